@@ -1,14 +1,35 @@
+import time
+
+# Record when the application started (before the heavy imports) so startup time can be measured
+STARTUP_STARTED = time.perf_counter()
+
+import heapq
+import itertools
 import json
 import random
 import os
 import re
+import sys
+import threading
 import openai
 import tkinter as tk
+from collections import Counter, deque
+from concurrent.futures import Future, as_completed
 from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from tkinter import scrolledtext
 import tkinter.messagebox as messagebox
 from dotenv import load_dotenv
 from tkinter import ttk
+from tkinter import filedialog
+from pb_core import (
+    JSON_DIR, NON_CATEGORY_FILES, NO_CONSTRAINTS, RandomSampler, SamplingConstraints, WordIndex,
+    compile_template, create_sampler, create_sink, export_prompts, is_overlay_edit, is_word_list,
+    load_category_types, load_words, parse_implied_categories, resolve_vocabulary
+)
+
+# Startup time budget in seconds, from launch until the window first becomes idle
+STARTUP_TIME_BUDGET = 1.0
 
 # Load the environment variables from the .env file
 load_dotenv()
@@ -17,12 +38,32 @@ load_dotenv()
 root = tk.Tk()
 root.title("Prompt Generator")
 
-# Define the name of the subdirectory where JSON files are stored
-JSON_DIR = "jsons"
+# Overlay directories applied in order on top of JSON_DIR (separated like PATH entries)
+VOCABULARY_OVERLAY_DIRS = tuple(path for path in os.environ.get("PB_OVERLAY_DIRS", "").split(os.pathsep) if path)
 
 # Initialize CATEGORIES_BY_TYPE as a dictionary with default empty lists
 CATEGORIES_BY_TYPE = {}
 
+# The shared vocabulary snapshot (category types and cached category words)
+VOCABULARY = None
+
+# AI rate limits (requests and tokens per minute) and the number of concurrent AI calls
+AI_REQUESTS_PER_MINUTE = int(os.environ.get("PB_AI_REQUESTS_PER_MINUTE", "60"))
+AI_TOKENS_PER_MINUTE = int(os.environ.get("PB_AI_TOKENS_PER_MINUTE", "60000"))
+AI_WORKERS = 4
+
+# Interactive AI calls are scheduled before bulk ones (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Progress of the bulk AI Populate job, so it can resume after a crash
+AI_POPULATE_CHECKPOINT_FILE = 'ai_populate_checkpoint.json'
+AI_POPULATE_DRY_RUN_CHECKPOINT_FILE = 'ai_populate_checkpoint.dry-run.json'
+
+# Background prompt pool: how many of the most-used templates are pre-rendered, and how many prompts each keeps
+PROMPT_POOL_TEMPLATES = 5
+PROMPT_POOL_SIZE = 200
+
 # Define global variables for category combination functionality
 selected_categories = []
 
@@ -53,41 +94,6 @@ num_prompts_to_generate = tk.IntVar(value=1)
 
 #Startup
 
-def load_words(category):
-    """Load words from JSON file for the given category."""
-    # Build the file path using the JSON_DIR constant
-    file_path = os.path.join(JSON_DIR, f'{category}.json')
-    try:
-        with open(file_path, 'r') as file:
-            words = json.load(file)
-        return words
-    except FileNotFoundError:
-        print(f'Error: JSON file for category "{category}" not found.')
-    except json.JSONDecodeError as e:
-        print(f'Error: JSON file for category "{category}" contains invalid JSON. {e}')
-    return []
-
-def load_category_types():
-    """Load category types from JSON file or prompt user for default category types."""
-    # Build the file path using the JSON_DIR constant
-    file_path = os.path.join(JSON_DIR, 'category_types.json')
-    try:
-        with open(file_path, 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print('Error: Unable to load category types. JSON file not found.')
-        # Prompt user for default category types
-        default_category_types = input("Enter default category types separated by comma (e.g., uncategorized,nouns): ").strip()
-        # Convert input to dictionary format and remove extra spaces
-        default_categories_dict = {category_type.strip(): [] for category_type in default_category_types.split(',')}
-        # Write the default categories to a new JSON file
-        with open(file_path, 'w') as file:
-            json.dump(default_categories_dict, file, indent=2)
-        return default_categories_dict
-    except json.JSONDecodeError as e:
-        print(f'Error: Unable to load category types. Invalid JSON. {e}')
-    return {'uncategorized': [], 'nouns': []}
-
 def load_category_types_explained():
     # Define the path to the JSON file that contains the category types explanation
     json_file = "category_types_explained.json"
@@ -102,39 +108,137 @@ def load_history_from_json():
             return json.load(file)
     return []
 
+def load_vocabulary():
+    """Load JSON_DIR and its overlays into a new shared vocabulary snapshot."""
+    global VOCABULARY, CATEGORIES_BY_TYPE
+    VOCABULARY = resolve_vocabulary(JSON_DIR, VOCABULARY_OVERLAY_DIRS, reload=True)
+    CATEGORIES_BY_TYPE = VOCABULARY.category_types
+    return VOCABULARY
+
 #Prompt Creation
 
+class PromptPool:
+    """Prompts pre-rendered in the background for the most-used templates, in bounded ring buffers.
+
+    Only plain random draws are pooled (no balanced sampling or constraints). The pool
+    belongs to one vocabulary snapshot version and is emptied when the vocabulary changes.
+    """
+
+    def __init__(self, templates=PROMPT_POOL_TEMPLATES, size=PROMPT_POOL_SIZE):
+        self.templates = templates
+        self.size = size
+        # Template -> deque of (prompt, slots)
+        self.buffers = {}
+        self.version = None
+        self.usage = Counter()
+        self.lock = threading.Lock()
+        self.refill_needed = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the background refill thread."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.refill_needed.set()
+
+    def record_use(self, template):
+        """Count a use of the template so the most-used templates are pooled."""
+        with self.lock:
+            self.usage[template] += 1
+
+    def hot_templates(self):
+        """Return the most-used templates, with the most recent history entries breaking ties."""
+        # Copy the counts and history, which the Tk thread changes while the pool runs
+        with self.lock:
+            usage = Counter(self.usage)
+        recency = {template: index for index, template in enumerate(list(template_history))}
+        candidates = [template for template in set(usage) | set(recency) if template]
+        candidates.sort(key=lambda template: (usage[template], recency.get(template, -1)), reverse=True)
+        return candidates[:self.templates]
+
+    def take(self, template, count):
+        """Take up to count pre-rendered (prompt, slots) pairs for the template and schedule a refill."""
+        taken = []
+        with self.lock:
+            buffer = self.buffers.get(template)
+            if buffer is not None and self.version == VOCABULARY.version:
+                while buffer and len(taken) < count:
+                    taken.append(buffer.popleft())
+        self.refill_needed.set()
+        return taken
+
+    def run(self):
+        while True:
+            self.refill_needed.wait()
+            self.refill_needed.clear()
+            try:
+                self.refill()
+            except Exception as e:
+                # Keep the thread alive; the next take() schedules another refill
+                print(f"Error: Failed to refill the prompt pool. {e}")
+
+    def refill(self):
+        """Render prompts for the hot templates until every buffer is full."""
+        vocabulary = VOCABULARY
+        with self.lock:
+            if self.version != vocabulary.version:
+                # The vocabulary changed: drop every prompt rendered from the old one
+                self.buffers = {}
+                self.version = vocabulary.version
+        hot = self.hot_templates()
+        with self.lock:
+            for template in list(self.buffers):
+                if template not in hot:
+                    del self.buffers[template]
+        sampler = RandomSampler(random.Random())
+        for template in hot:
+            compiled = compile_template(template, vocabulary)
+            with self.lock:
+                buffer = self.buffers.setdefault(template, deque(maxlen=self.size))
+                missing = self.size - len(buffer)
+            rendered = [compiled.render(sampler) for _ in range(missing)]
+            with self.lock:
+                if self.version != vocabulary.version:
+                    break
+                buffer.extend(rendered[:self.size - len(buffer)])
+
 def build_prompt(template):
     """Build a prompt using the provided template and word categories."""
-    for category_type, categories in CATEGORIES_BY_TYPE.items():
-        while f'[{category_type}]' in template:
-            # Randomly select a category from the category type
-            selected_category = random.choice(categories)
-            words = load_words(selected_category)
-            selected_word = random.choice(words) if words else ''
-            template = template.replace(f'[{category_type}]', selected_word, 1)
-
-    # Update the regular expression pattern to include hyphens
-    combined_category_placeholders = re.findall(r'\[([\w/-]+)\]', template)
-
-    for combined_categories in combined_category_placeholders:
-        # Split combined categories into a list
-        categories = combined_categories.split('/')
-        # Randomly select a category from the list
-        selected_category = random.choice(categories)
-        # Load words for the selected category
-        words = load_words(selected_category)
-        # Randomly select a word from the list
-        selected_word = random.choice(words) if words else ''
-        # Replace the placeholder with the selected word
-        template = template.replace(f'[{combined_categories}]', selected_word, 1)
+    prompt, _ = build_prompt_with_slots(template)
+    return prompt
 
-    return template
+def build_prompt_with_slots(template, rng=random, constraints=NO_CONSTRAINTS):
+    """Build a prompt and return it together with the (placeholder, category, word) chosen per slot."""
+    return compile_template(template, VOCABULARY, constraints).render(RandomSampler(rng))
+
+def get_sampling_constraints():
+    """Read the sampling constraints from the Generate tab, or show an error and return None if they are invalid."""
+    exclude = [word.strip() for word in exclude_words_entry.get().split(',') if word.strip()]
+    try:
+        implies = parse_implied_categories(implies_entry.get())
+    except ValueError as e:
+        messagebox.showerror("Error", f"Invalid implied category rule. {e}")
+        return None
+    # A rule for an unknown category would never apply, so it is most likely a typo
+    unknown = [category for category in implies.values() if not VOCABULARY.has_category(category)]
+    if unknown:
+        messagebox.showerror("Error", f'Unknown category "{unknown[0]}" in the implied category rules.')
+        return None
+    return SamplingConstraints(distinct=distinct_words.get(), exclude=exclude, implies=implies)
 
 def generate_prompt():
     """Generate prompts using the user-defined template and display them."""
     global template_entry, template_history  # Access the global variables
 
+    # The template is entered in the Template Builder tab
+    if not template_entry_ready():
+        return
+
+    # Read the sampling constraints before anything changes, so invalid rules change nothing
+    constraints = get_sampling_constraints()
+    if constraints is None:
+        return
+
     # Get the template from the template_entry widget
     template = template_entry.get("1.0", tk.END).strip()  # Remove the trailing newline character
 
@@ -152,10 +256,20 @@ def generate_prompt():
     # Get the number of prompts to generate
     num_prompts = num_prompts_to_generate.get()
 
+    # Get the compiled template from the cache and share one sampler across the batch
+    compiled = compile_template(template, VOCABULARY, constraints)
+    sampler = create_sampler(balanced_sampling.get(), balanced_category_sampling.get())
+
+    # Use pre-rendered prompts from the pool for plain random draws
+    prompt_pool.record_use(template)
+    pooled_prompts = []
+    if not balanced_sampling.get() and constraints.key() == NO_CONSTRAINTS.key():
+        pooled_prompts = [prompt for prompt, _ in prompt_pool.take(template, num_prompts)]
+
     # Generate the specified number of prompts
-    for _ in range(num_prompts):
+    for index in range(num_prompts):
         # Build and display the prompt
-        prompt = build_prompt(template)
+        prompt = pooled_prompts[index] if index < len(pooled_prompts) else compiled.render(sampler)[0]
         prompt_label = tk.Label(tab_main, text=prompt, wraplength=600, font=("Helvetica", 12))
         prompt_label.pack(pady=10)
         # Bind the left mouse button click event to the copy_to_clipboard function for the prompt label
@@ -166,47 +280,48 @@ def generate_prompt():
 def generate_prompt_gpt():
     """Generate a prompt using the GPT API and the user-defined template."""
     global template_entry  # Access the global variable
+    # The template is entered in the Template Builder tab
+    if not template_entry_ready():
+        return
     # Get the template from the template_entry widget
     template = template_entry.get("1.0", tk.END)[:-1]  # Remove the trailing newline character
     
     # Get the number of prompts to generate
     num_prompts = num_prompts_to_generate.get()
 
-    # Initialize a list to store the generated prompts
-    generated_prompts = []
-
-    # Generate the specified number of prompts
+    # Queue one AI call per prompt to generate
+    futures = []
     for _ in range(num_prompts):
         # Prepare the conversation messages
         messages = [
             {"role": "system", "content": "You are a helpful assistant. Your task is to replace the brackets in the provided template. Each bracket contains a category name, and you should replace the bracket with a word or phrase that matches the specified category. For example, if the template is 'The [color] [animal] jumped over the fence', you could complete it as 'The brown rabbit jumped over the fence' Make sure to not leave any brackets in the completion."},
             {"role": "user", "content": f"replace the brackets with a random appropriate completions: {template}"}
         ]
+        # Call the OpenAI Chat API through the rate-limited scheduler
+        futures.append(call_chat_completion(messages))
+
+    def show_prompts():
+        # Initialize a list to store the generated prompts
+        generated_prompts = []
+        for future in futures:
+            try:
+                # Extract the assistant's response
+                prompt = future.result()['choices'][0]['message']['content']
+
+                if prompt:
+                    # Append the generated prompt to the list
+                    generated_prompts.append(prompt)
+                else:
+                    generated_prompts.append("Failed to generate text.")
+            except Exception as e:
+                print(f"Error: {e}")
+                generated_prompts.append("Failed to generate text.")
 
-        # Call the OpenAI Chat API
-        try:
-            # Set the OpenAI API key
-            openai.api_key = os.environ.get("OPENAI_API_KEY")
-
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages
-            )
+        # Display the generated prompts
+        prompt_label.config(text="\n".join(generated_prompts))
 
-            # Extract the assistant's response
-            prompt = response['choices'][0]['message']['content']
-
-            if prompt:
-                # Append the generated prompt to the list
-                generated_prompts.append(prompt)
-            else:
-                generated_prompts.append("Failed to generate text.")
-        except Exception as e:
-            print(f"Error: {e}")
-            generated_prompts.append("Failed to generate text.")
-    
-    # Display the generated prompts
-    prompt_label.config(text="\n".join(generated_prompts))
+    # Show the prompts once every call has finished, without blocking the window
+    when_done(futures, show_prompts)
 
 def clear_generated_prompts():
     """Clear all previously generated prompt labels."""
@@ -232,37 +347,29 @@ def copy_to_clipboard(event, prompt_text):
     event.widget.after(100, lambda: event.widget.config(fg=original_fg))
 
 def show_category_words(event, category):
-    """Open a new window to display all the words in the selected category."""
-    # Load words for the current category from JSON file
-    words = load_words(category)
-
-    # Sort the words alphabetically
-    words = sorted(words)
+    """Open a browser window listing the words in the selected category, with a filter box."""
+    # Get words for the current category from the shared vocabulary and sort them alphabetically
+    words = sorted(VOCABULARY.words(category))
 
     # Create a new window to display the words
     words_window = tk.Toplevel(root)
-    words_window.title(f"Words in '{category}' category")
-
-    # Create a label to display the words in the new window
-    words_label = tk.Label(words_window, text="\n".join(words), font=("Helvetica", 12))
-    words_label.pack(pady=10)
+    words_window.title(f"Words in '{category}' category ({len(words)})")
 
-    # Define the default width and height for the window (in pixels)
-    default_width = 300
-    default_height = 200
+    # Create an entry to filter the words as you type
+    filter_entry = tk.Entry(words_window)
+    filter_entry.pack(fill=tk.X, padx=5, pady=5)
 
-    # Set the default geometry of the words_window
-    words_window.geometry(f"{default_width}x{default_height}")
+    # Only the visible rows are put into the list, so large categories open instantly
+    words_list = VirtualList(words_window, rows=20, font=("Helvetica", 12))
+    words_list.frame.pack(fill=tk.BOTH, expand=True)
+    words_list.set_items(words)
 
-    # Calculate the width of the longest word in pixels
-    max_word_width = max(words_label.winfo_reqwidth() for word in words)
-    # Define the margin space in pixels
-    margin_space = 20
-    # Calculate the total window width
-    words_window_width = max(default_width, max_word_width + margin_space)
+    def filter_words(event):
+        text = filter_entry.get().strip().lower()
+        words_list.set_items([word for word in words if text in word.lower()] if text else words)
 
-    # Update the width of the words_window to the calculated width
-    words_window.geometry(f"{words_window_width}x{words_window.winfo_reqheight()}")
+    filter_entry.bind('<KeyRelease>', filter_words)
+    filter_entry.focus_set()
 
 def save_history_to_json():
     with open(HISTORY_JSON_FILE, 'w') as file:
@@ -271,17 +378,513 @@ def save_history_to_json():
 def update_history_tab():
     """Update the History tab based on the updated template history."""
     global history_listbox  # Access the global variable
+    # The History tab fills itself from template_history when it is first opened
+    if history_listbox is None:
+        return
     # Clear the ListBox
     history_listbox.delete(0, tk.END)
     # Update the ListBox with the new history items
     for template in template_history:
         history_listbox.insert(tk.END, template)
 
+#Output Sinks
+
+def export_generated_prompts():
+    """Ask for an output file and export the requested number of prompts to it."""
+    if not template_entry_ready():
+        return
+    template = template_entry.get("1.0", tk.END).strip()
+    constraints = get_sampling_constraints()
+    if constraints is None:
+        return
+    path = filedialog.asksaveasfilename(
+        title="Export Prompts",
+        defaultextension=".jsonl",
+        filetypes=[("JSON Lines", "*.jsonl"), ("CSV", "*.csv"), ("Text", "*.txt"), ("SQLite", "*.db"),
+                   ("Compressed", "*.gz *.zst"), ("All files", "*.*")]
+    )
+    if not path:
+        return
+    global export_thread
+    if export_thread is not None and export_thread.is_alive():
+        messagebox.showinfo("Export", "An export is already running.")
+        return
+    # Read the settings here: Tk variables must only be used on the Tk thread
+    count = num_prompts_to_generate.get()
+    vocabulary = VOCABULARY
+    options = {
+        "balanced": balanced_sampling.get(),
+        "balance_categories": balanced_category_sampling.get(),
+    }
+    progress = {"done": 0, "total": count}
+    result = {}
+
+    def run():
+        try:
+            compiled = compile_template(template, vocabulary, constraints)
+            with create_sink(path) as sink:
+                export_prompts(compiled, count, sink, progress=progress, **options)
+            result["done"] = True
+        except Exception as e:
+            # Any failure (I/O, compression, a bad word) is reported instead of ending the thread silently
+            result["error"] = e
+
+    # Export on a worker thread so large exports do not freeze the window
+    export_thread = threading.Thread(target=run, daemon=True)
+    export_thread.start()
+    poll_export(path, progress, result)
+
+def poll_export(path, progress, result):
+    """Show the export progress and report errors when the export finishes."""
+    if export_thread.is_alive():
+        export_status.config(text=f'Exporting: {progress["done"]}/{progress["total"]} prompts')
+        root.after(500, poll_export, path, progress, result)
+        return
+    if "done" not in result:
+        # Only an export that finished is reported as a success
+        export_status.config(text="Export failed.")
+        messagebox.showerror("Error", f'Failed to export prompts. {result.get("error", "The export stopped unexpectedly.")}')
+    else:
+        export_status.config(text=f'Exported {progress["total"]} prompts to {os.path.basename(path)}')
+
 # Print the keys (category types) of the CATEGORIES_BY_TYPE dictionary
 print(CATEGORIES_BY_TYPE.keys())
 
+#Search
+
+def vocabulary_files():
+    """Return the names of all word list files in JSON_DIR and its overlays (without the .json extension)."""
+    return sorted({
+        os.path.splitext(name)[0]
+        for directory in (JSON_DIR, *VOCABULARY_OVERLAY_DIRS) for name in os.listdir(directory)
+        if name.endswith('.json') and name not in NON_CATEGORY_FILES
+    })
+
+def schedule_word_index(categories=None, batch_size=10):
+    """Index the given categories (default: every word list file) a few at a time while the GUI is idle."""
+    pending = list(categories if categories is not None else vocabulary_files())
+
+    def index_next_batch():
+        for category in pending[:batch_size]:
+            WORD_INDEX.add_category(category, VOCABULARY.words(category))
+        del pending[:batch_size]
+        if pending:
+            root.after(1, index_next_batch)
+
+    root.after_idle(index_next_batch)
+
+class VirtualList:
+    """A scrollable Listbox that only holds the visible rows of a (possibly very long) list."""
+
+    def __init__(self, parent, rows=20, format_item=str, **options):
+        self.frame = tk.Frame(parent)
+        self.rows = rows
+        self.format_item = format_item
+        self.items = []
+        self.first = 0
+        self.listbox = tk.Listbox(self.frame, height=rows, **options)
+        self.scrollbar = tk.Scrollbar(self.frame, command=self.scroll)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Scroll with the mouse wheel (Windows/macOS and X11)
+        self.listbox.bind('<MouseWheel>', lambda event: self.scroll('scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.listbox.bind('<Button-4>', lambda event: self.scroll('scroll', -1, 'units'))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll('scroll', 1, 'units'))
+
+    def set_items(self, items):
+        """Replace the items and scroll back to the top."""
+        self.items = items
+        self.first = 0
+        self.redraw()
+
+    def redraw(self):
+        """Fill the Listbox with the visible rows and update the scrollbar."""
+        self.listbox.delete(0, tk.END)
+        visible = self.items[self.first:self.first + self.rows]
+        if visible:
+            self.listbox.insert(tk.END, *(self.format_item(item) for item in visible))
+        total = max(1, len(self.items))
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + self.rows) / total))
+
+    def scroll(self, action, amount, unit=None):
+        """Handle the scrollbar's moveto/scroll commands by moving the visible window."""
+        if action == 'moveto':
+            first = int(float(amount) * len(self.items))
+        else:
+            first = self.first + int(amount) * (self.rows if unit == 'pages' else 1)
+        self.first = max(0, min(first, len(self.items) - self.rows))
+        self.redraw()
+        return 'break'
+
+    def selected_item(self):
+        """Return the selected item, or None if nothing is selected."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return None
+        return self.items[self.first + selection[0]]
+
+def search_dictionary(event):
+    """Show the words matching the search box as you type."""
+    search_results_list.set_items(WORD_INDEX.search(dictionary_search_entry.get()))
+
+def open_search_result(event):
+    """Open the category browser for the selected search result."""
+    selected = search_results_list.selected_item()
+    if selected:
+        show_category_words(event, selected[1])
+
+#AI Scheduling
+
+class TokenBucket:
+    """A token bucket holding up to `per_minute` tokens that refills continuously."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Return how many seconds until `amount` tokens are available (0 if they are now)."""
+        self.refill()
+        # A request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        """Take tokens; a negative amount gives tokens back (e.g. when fewer were used than estimated)."""
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+def estimate_tokens(messages, completion_tokens=500):
+    """Roughly estimate the tokens used by a chat request (about 4 characters per token)."""
+    return sum(len(message["content"]) for message in messages) // 4 + completion_tokens
+
+class AIScheduler:
+    """Run AI calls on worker threads within requests-per-minute and tokens-per-minute limits.
+
+    Calls wait in a priority queue, so interactive calls run before queued bulk calls.
+    A call that does not fit the limits yet goes back into the queue, so a higher
+    priority call submitted meanwhile is still picked first.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, workers=AI_WORKERS):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.workers = workers
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.threads = []
+
+    def submit(self, call, tokens, priority=PRIORITY_INTERACTIVE):
+        """Queue call() using an estimated number of tokens and return a Future for its result.
+
+        If the result has a "usage" entry, the token estimate is corrected with the actual usage.
+        """
+        future = Future()
+        with self.condition:
+            if not self.threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self.run_worker, daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            heapq.heappush(self.queue, (priority, next(self.sequence), tokens, call, future))
+            self.condition.notify()
+        return future
+
+    def run_worker(self):
+        while True:
+            with self.condition:
+                while True:
+                    while not self.queue:
+                        self.condition.wait()
+                    priority, sequence, tokens, call, future = self.queue[0]
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if wait == 0:
+                        heapq.heappop(self.queue)
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        break
+                    # Wait for the limits (or a new call) and look at the queue again
+                    self.condition.wait(wait)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = call()
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            usage = result.get("usage") if isinstance(result, dict) else None
+            if usage and "total_tokens" in usage:
+                with self.condition:
+                    self.tokens.take(usage["total_tokens"] - tokens)
+            future.set_result(result)
+
+def chat_completion(messages, api_base=None, api_key=None):
+    """Call the OpenAI Chat API directly, optionally against another endpoint (e.g. a local stub)."""
+    if api_key:
+        # Pass the key with the call so it does not replace the key used by other calls
+        options = {"api_key": api_key}
+    else:
+        # Set the OpenAI API key
+        openai.api_key = os.environ.get("OPENAI_API_KEY")
+        options = {}
+    if api_base:
+        options["api_base"] = api_base
+    return openai.ChatCompletion.create(model="gpt-3.5-turbo", messages=messages, **options)
+
+def call_chat_completion(messages, priority=PRIORITY_INTERACTIVE):
+    """Queue a call to the OpenAI Chat API on the rate-limited scheduler and return its Future.
+
+    Call this from the Tk thread and handle the response with when_done, so the window
+    stays responsive while the call waits for the rate limits.
+    """
+    return AI_SCHEDULER.submit(partial(chat_completion, messages), estimate_tokens(messages), priority)
+
+def when_done(futures, callback, interval=100):
+    """Call callback() on the Tk thread once all futures are done, checking every interval ms."""
+    if all(future.done() for future in futures):
+        callback()
+    else:
+        root.after(interval, when_done, futures, callback, interval)
+
+def populate_messages(category, current_words):
+    """Prepare the conversation messages asking for more words in a category."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant. Your task is to suggest additional words that match the specified category. Do not suggest any words that are already on the list. Respond with each suggested word in quotes."},
+        {"role": "user", "content": f"Category: {category}. Current list: {current_words}. Suggest some additional words that match the category and are not already on the list."}
+    ]
+
+def parse_suggested_words(ai_response):
+    """Extract the single-quoted and double-quoted words from an AI response."""
+    suggested_words = re.findall(r'"([^"]+)"|\'([^\']+)\'' , ai_response)
+    # Flatten the list of tuples and filter out empty strings
+    return [word for tup in suggested_words for word in tup if word]
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Answer chat completion requests with fixed suggestions, for dry runs without the real API."""
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        content = request.get("messages", [{}])[-1].get("content", "")
+        category = re.match(r'Category: (.*?)\. Current list', content)
+        name = category.group(1) if category else 'word'
+        body = json.dumps({
+            "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": f'"{name} stub 1", "{name} stub 2"'
+            }}],
+            "usage": {"prompt_tokens": len(content) // 4, "completion_tokens": 10, "total_tokens": len(content) // 4 + 10},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_endpoint():
+    """Start a local stub of the chat completions endpoint and return the server and its API base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+def stop_stub_endpoint(server):
+    """Stop a stub endpoint started by start_stub_endpoint and release its socket."""
+    server.shutdown()
+    server.server_close()
+
+def load_checkpoint(checkpoint_file):
+    """Load the bulk populate checkpoint, or start a new one."""
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r') as file:
+            return json.load(file)
+    return {"completed": [], "added": {}}
+
+def write_json_atomically(data, file_path):
+    """Write JSON to a temporary file and move it into place, so a crash never leaves a half-written file."""
+    temporary_file = file_path + '.tmp'
+    with open(temporary_file, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary_file, file_path)
+
+def save_checkpoint(checkpoint, checkpoint_file):
+    """Write the checkpoint atomically."""
+    write_json_atomically(checkpoint, checkpoint_file)
+
+def read_word_list(category):
+    """Read the words the bulk job adds to, like editable_words: the resolved words when overlays are used.
+
+    The category's file in JSON_DIR and in every overlay is read strictly, raising ValueError
+    (or OSError) if one is not valid, so the bulk job never saves words resolved from a file
+    it failed to read. A missing file is an empty list, since writing a new file overwrites nothing.
+    """
+    words = []
+    for directory in (JSON_DIR, *VOCABULARY_OVERLAY_DIRS):
+        file_path = os.path.join(directory, f'{category}.json')
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'rb') as file:
+            words = json.loads(file.read().decode('utf-8'))
+        # Overlay files may also hold edits (replace, remove and add lists)
+        if not (is_word_list(words) if directory == JSON_DIR else is_overlay_edit(words)):
+            raise ValueError(f'"{file_path}" is not a valid word list')
+    if VOCABULARY_OVERLAY_DIRS:
+        # The words are saved to the top overlay as a full list, so start from the resolved words
+        return list(VOCABULARY.words(category)) if VOCABULARY.has_category(category) else []
+    return words
+
+def populate_checkpoint_file(dry_run=False):
+    """Return the checkpoint file of the bulk populate job (dry runs keep their own)."""
+    return AI_POPULATE_DRY_RUN_CHECKPOINT_FILE if dry_run else AI_POPULATE_CHECKPOINT_FILE
+
+def bulk_populate(categories, dry_run=False, checkpoint_file=None, progress=None, fresh=False):
+    """Ask the AI for more words in every category, resuming an unfinished run from its checkpoint.
+
+    Calls run at bulk priority through the scheduler. Each category's new words are saved
+    before the category is checkpointed, and the checkpoint is removed once the run has gone
+    through every category (failed ones are retried by the next run). fresh discards the
+    checkpoint of an unfinished run. A dry run talks to a local stub endpoint and writes no word lists.
+    progress, if given, is a dict updated with "done", "total", "resumed" and "current".
+    Returns the number of words added per category in this run, the failed categories and
+    the number of categories skipped because the resumed run had already done them.
+    """
+    checkpoint_file = checkpoint_file or populate_checkpoint_file(dry_run)
+    if fresh and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    stub_server, api_base = start_stub_endpoint() if dry_run else (None, None)
+    try:
+        return run_bulk_populate(categories, dry_run, checkpoint_file, progress, api_base)
+    finally:
+        if stub_server is not None:
+            stop_stub_endpoint(stub_server)
+
+def run_bulk_populate(categories, dry_run, checkpoint_file, progress, api_base):
+    """Run the bulk populate job for bulk_populate, calling api_base (the stub) on dry runs."""
+    # The stub does not check the key, so dry runs work without a real one
+    api_key = "dry-run" if dry_run else None
+    categories = list(dict.fromkeys(categories))
+    checkpoint = load_checkpoint(checkpoint_file)
+    completed = set(checkpoint["completed"])
+    pending = [category for category in categories if category not in completed]
+    resumed = len(categories) - len(pending)
+    if progress is not None:
+        progress.update(done=resumed, total=len(categories), resumed=resumed, current=None)
+
+    # Queue every pending category; the scheduler keeps the calls within the rate limits
+    futures = {}
+    failed = []
+    added = {}
+    for category in pending:
+        try:
+            current_words = read_word_list(category)
+        except (OSError, ValueError) as e:
+            print(f'Error: AI Populate skipped category "{category}". Its word list could not be read. {e}')
+            failed.append(category)
+            continue
+        messages = populate_messages(category, current_words)
+        futures[AI_SCHEDULER.submit(
+            partial(chat_completion, messages, api_base, api_key), estimate_tokens(messages), PRIORITY_BULK
+        )] = category
+
+    for future in as_completed(futures):
+        category = futures[future]
+        try:
+            new_words = parse_suggested_words(future.result()['choices'][0]['message']['content'])
+            # Re-read the words so edits made while waiting are kept
+            current_words = read_word_list(category)
+        except Exception as e:
+            print(f'Error: AI Populate failed for category "{category}". {e}')
+            failed.append(category)
+            continue
+        new_words = [word for word in dict.fromkeys(new_words) if word not in current_words]
+        if dry_run:
+            print(f'Dry run: would add {len(new_words)} words to "{category}": {new_words}')
+        elif new_words:
+            # Save where the Dictionary editor saves (the top overlay when overlays are used)
+            write_json_atomically(sorted(current_words + new_words), category_file_path(category))
+        checkpoint["completed"].append(category)
+        checkpoint["added"][category] = added[category] = len(new_words)
+        save_checkpoint(checkpoint, checkpoint_file)
+        if progress is not None:
+            progress.update(done=progress["done"] + 1, current=category)
+
+    # The run is finished: the next run starts fresh and retries the failed categories
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    return added, failed, resumed
+
+def ai_populate_all(dry_run=False):
+    """Start the bulk AI Populate job over every category in a background thread."""
+    global bulk_populate_thread
+    if bulk_populate_thread is not None and bulk_populate_thread.is_alive():
+        messagebox.showinfo("AI Populate All", "AI Populate All is already running.")
+        return
+    categories = [category for categories in CATEGORIES_BY_TYPE.values() for category in categories]
+    # An unfinished run (e.g. after a crash) can be resumed or discarded
+    fresh = False
+    checkpoint_file = populate_checkpoint_file(dry_run)
+    if os.path.exists(checkpoint_file):
+        answer = messagebox.askyesnocancel(
+            "AI Populate All",
+            f'An unfinished run has already done {len(load_checkpoint(checkpoint_file)["completed"])} categories. '
+            'Resume it? Choose "No" to start fresh.'
+        )
+        if answer is None:
+            return
+        fresh = not answer
+    progress = {"done": 0, "total": len(categories), "resumed": 0, "current": None}
+    result = {}
+
+    def run():
+        result["value"] = bulk_populate(categories, dry_run=dry_run, progress=progress, fresh=fresh)
+
+    bulk_populate_thread = threading.Thread(target=run, daemon=True)
+    bulk_populate_thread.start()
+    poll_bulk_populate(progress, result, dry_run)
+
+def poll_bulk_populate(progress, result, dry_run):
+    """Show the bulk populate progress and reload the vocabulary when the job finishes."""
+    prefix = "Dry run: " if dry_run else ""
+    if progress["resumed"]:
+        prefix += f'resumed after {progress["resumed"]} categories, '
+    if bulk_populate_thread.is_alive():
+        ai_populate_status.config(text=f'{prefix}{progress["done"]}/{progress["total"]} categories ({progress["current"] or "starting"})')
+        root.after(500, poll_bulk_populate, progress, result, dry_run)
+        return
+    if "value" not in result:
+        ai_populate_status.config(text=f"{prefix}AI Populate All stopped with an error; run it again to resume.")
+        return
+    added, failed, _ = result["value"]
+    # Only the words of this run are counted; a dry run writes nothing
+    words = f'would add {sum(added.values())} words' if dry_run else f'added {sum(added.values())} words'
+    ai_populate_status.config(text=f'{prefix}{words}' + (f', {len(failed)} categories failed (run again to retry)' if failed else ''))
+    if not dry_run:
+        # Use and index the new words
+        load_vocabulary()
+        schedule_word_index(list(added))
+
 #JSON Editor
 
+def category_file_path(category):
+    """Return the file the Dictionary editor saves a category to: the top overlay directory, or JSON_DIR."""
+    directory = VOCABULARY_OVERLAY_DIRS[-1] if VOCABULARY_OVERLAY_DIRS else JSON_DIR
+    return os.path.join(directory, f'{category}.json')
+
+def editable_words(category):
+    """Return the words the Dictionary editor works on: the resolved words when overlays are used."""
+    if VOCABULARY_OVERLAY_DIRS:
+        return list(VOCABULARY.words(category))
+    return load_words(category)
+
 def load_selected_category(event):
     # Get the selected item in the Treeview
     selected_item = category_treeview.focus()
@@ -292,7 +895,7 @@ def load_selected_category(event):
         category = category_treeview.item(selected_item, 'text')
 
         # Load words for the selected category
-        words = load_words(category)
+        words = editable_words(category)
 
         # Display the words in the Text widget as JSON
         json_text_editor.delete("1.0", tk.END)
@@ -313,17 +916,26 @@ def save_edited_json():
         # Get the edited content from the text editor
         edited_content = json_text_editor.get("1.0", tk.END).strip()
 
-        # Build the file path using the JSON_DIR constant
-        file_path = os.path.join(JSON_DIR, f'{selected_category}.json')
+        # Build the file path (the top overlay directory when overlays are used)
+        file_path = category_file_path(selected_category)
 
         try:
             # Parse the edited content as JSON
             words = json.loads(edited_content)
+            # A category must be a list of words
+            if not is_word_list(words):
+                messagebox.showerror("Error", "A category must be a JSON list of strings.")
+                return
 
             # Save the edited content to the JSON file
             with open(file_path, 'w') as file:
                 json.dump(words, file, indent=2)
 
+            # Replace the shared vocabulary so new prompts use the saved words
+            load_vocabulary()
+            # Re-index only the saved category, with its resolved words
+            WORD_INDEX.add_category(selected_category, VOCABULARY.words(selected_category))
+
             # The success message popup has been removed
 
         except json.JSONDecodeError:
@@ -335,7 +947,8 @@ def open_edit_types_window():
     global edit_types_window, types_text_editor # Access the global variable
     # Create a new window to edit category types
     edit_types_window = tk.Toplevel(root)
-    edit_types_window.title("Edit Category Types")
+    # Category types are always edited in JSON_DIR, below any overlays
+    edit_types_window.title(f"Edit Category Types ({JSON_DIR})")
 
     # Create the Text widget for editing category types
     types_text_editor = tk.Text(edit_types_window, wrap=tk.NONE)
@@ -367,6 +980,8 @@ def save_edited_types():
             json.dump(category_types, file, indent=2)
         # Close the editor window after saving changes
         edit_types_window.destroy()
+        # Replace the shared vocabulary with the updated category types
+        load_vocabulary()
         # Refresh the category Treeview to reflect the updated category types
         refresh_category_treeview()
     except json.JSONDecodeError:
@@ -378,15 +993,28 @@ def refresh_category_treeview():
     global category_treeview
     # Clear all items from the Treeview
     category_treeview.delete(*category_treeview.get_children())
-    # Load the updated category types from the JSON file
-    category_types = load_category_types()
-    # Populate the Treeview with the updated category types and categories
-    for category_type, categories in category_types.items():
+    # Populate the Treeview with the category types of the shared vocabulary
+    populate_category_treeview()
+
+def populate_category_treeview():
+    """Insert the category types; their categories are inserted when a type is first expanded."""
+    for category_type, categories in CATEGORIES_BY_TYPE.items():
         # Insert the category type as a parent node
         category_type_id = category_treeview.insert("", "end", text=category_type)
-        for category in categories:
+        if categories:
+            # Insert a placeholder child so the type can be expanded
+            category_treeview.insert(category_type_id, "end", text="", tags=("placeholder",))
+
+def expand_category_type(event):
+    """Replace the placeholder of an expanded category type with its categories."""
+    selected_item = category_treeview.focus()
+    children = category_treeview.get_children(selected_item)
+    if len(children) == 1 and "placeholder" in category_treeview.item(children[0], 'tags'):
+        category_treeview.delete(children[0])
+        category_type = category_treeview.item(selected_item, 'text')
+        for category in CATEGORIES_BY_TYPE.get(category_type, []):
             # Insert the category as a child node of the category type
-            category_treeview.insert(category_type_id, "end", text=category)
+            category_treeview.insert(selected_item, "end", text=category)
 
 def save_edited_json():
     # Get the selected item in the Treeview
@@ -397,14 +1025,22 @@ def save_edited_json():
         selected_category = category_treeview.item(selected_item, 'text')
         # Get the edited content from the text editor
         edited_content = json_text_editor.get("1.0", tk.END).strip()
-        # Build the file path using the JSON_DIR constant
-        file_path = os.path.join(JSON_DIR, f'{selected_category}.json')
+        # Build the file path (the top overlay directory when overlays are used)
+        file_path = category_file_path(selected_category)
         try:
             # Parse the edited content as JSON
             words = json.loads(edited_content)
+            # A category must be a list of words
+            if not is_word_list(words):
+                messagebox.showerror("Error", "A category must be a JSON list of strings.")
+                return
             # Save the edited content to the JSON file
             with open(file_path, 'w') as file:
                 json.dump(words, file, indent=2)
+            # Replace the shared vocabulary so new prompts use the saved words
+            load_vocabulary()
+            # Re-index only the saved category, with its resolved words
+            WORD_INDEX.add_category(selected_category, VOCABULARY.words(selected_category))
 
             # Remove the "highlight" tag after saving the changes
             json_text_editor.tag_remove("highlight", "1.0", tk.END)
@@ -437,52 +1073,45 @@ def ai_populate_category():
         # Get the category name
         category = category_treeview.item(selected_item, 'text')
         # Load words for the selected category
-        current_words = load_words(category)
+        current_words = editable_words(category)
         # Prepare the conversation messages
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant. Your task is to suggest additional words that match the specified category. Do not suggest any words that are already on the list. Respond with each suggested word in quotes."},
-            {"role": "user", "content": f"Category: {category}. Current list: {current_words}. Suggest some additional words that match the category and are not already on the list."}
-        ]
-        try:
-            # Set the OpenAI API key
-            openai.api_key = os.environ.get("OPENAI_API_KEY")
-            # Call the OpenAI Chat API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages
-            )
-            # Extract the assistant's response
-            ai_response = response['choices'][0]['message']['content']
-            # Debug information: Print the AI response to the console
-            print("AI Response:", ai_response)
-            # Use regular expressions to extract the list of suggested words from the response
-            # Updated regex to capture single-quoted and double-quoted words
-            suggested_words = re.findall(r'"([^"]+)"|\'([^\']+)\'' , ai_response)
-            # Flatten the list of tuples and filter out empty strings
-            suggested_words = [word for tup in suggested_words for word in tup if word]
-            # Filter out words that are already in the current list
-            new_words = [word for word in suggested_words if word not in current_words]
-            # Debug information: Print the new words to the console
-            print("New Words:", new_words)
-            if new_words:
-                # Append the new words to the current list
-                current_words.extend(new_words)
-                # Sort the updated list of words in alphabetical order
-                current_words = sorted(current_words)
-                # Convert the updated list of words to JSON format
-                updated_words_json = json.dumps(current_words, indent=2)
-                # Display the updated list of words in the JSON editor
-                json_text_editor.delete("1.0", tk.END)
-                json_text_editor.insert(tk.END, updated_words_json)
-                # Highlight only the new words
-                for new_word in new_words:
-                    start_index = json_text_editor.search(json.dumps(new_word), "1.0", tk.END)
-                    end_index = f"{start_index}+{len(json.dumps(new_word))}c"
-                    json_text_editor.tag_add("highlight", start_index, end_index)
-        except Exception as e:
-            # Debug information: Print the error message to the console
-            print("Error:", e)
-            messagebox.showerror("Error", "Failed to populate category using AI.")
+        messages = populate_messages(category, current_words)
+        # Call the OpenAI Chat API through the rate-limited scheduler and show the result when it arrives
+        future = call_chat_completion(messages)
+        when_done([future], lambda: show_populated_words(future, current_words))
+
+def show_populated_words(future, current_words):
+    """Show the current words plus the AI's new words in the JSON editor, highlighting the new ones."""
+    try:
+        # Extract the assistant's response
+        ai_response = future.result()['choices'][0]['message']['content']
+        # Debug information: Print the AI response to the console
+        print("AI Response:", ai_response)
+        # Extract the list of suggested words from the response
+        suggested_words = parse_suggested_words(ai_response)
+        # Filter out words that are already in the current list
+        new_words = [word for word in suggested_words if word not in current_words]
+        # Debug information: Print the new words to the console
+        print("New Words:", new_words)
+        if new_words:
+            # Append the new words to the current list
+            current_words.extend(new_words)
+            # Sort the updated list of words in alphabetical order
+            current_words = sorted(current_words)
+            # Convert the updated list of words to JSON format
+            updated_words_json = json.dumps(current_words, indent=2)
+            # Display the updated list of words in the JSON editor
+            json_text_editor.delete("1.0", tk.END)
+            json_text_editor.insert(tk.END, updated_words_json)
+            # Highlight only the new words
+            for new_word in new_words:
+                start_index = json_text_editor.search(json.dumps(new_word), "1.0", tk.END)
+                end_index = f"{start_index}+{len(json.dumps(new_word))}c"
+                json_text_editor.tag_add("highlight", start_index, end_index)
+    except Exception as e:
+        # Debug information: Print the error message to the console
+        print("Error:", e)
+        messagebox.showerror("Error", "Failed to populate category using AI.")
 
 def ai_suggest_category():
     """Use GPT to suggest words to add to the selected category."""
@@ -492,45 +1121,51 @@ def ai_suggest_category():
         # Get the category name
         category = category_treeview.item(selected_item, 'text')
         # Load words for the selected category
-        words = load_words(category)
+        words = editable_words(category)
         # Prepare the conversation messages
         messages = [
             {"role": "system", "content": "You are a helpful assistant. Your task is to suggest additional words that match the specified category. Do not suggest any words that are already on the list. Respond with each suggested word in quotes."},
             {"role": "user", "content": f"Category: {category}. Current list: {words}. Suggest some additional words that match the category and are not already on the list."}
         ]
-        try:
-            # Set the OpenAI API key
-            openai.api_key = os.environ.get("OPENAI_API_KEY")
-            # Call the OpenAI Chat API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages
-            )
-            # Extract the assistant's response
-            ai_response = response['choices'][0]['message']['content']
-            # Debug information: Print the AI response to the console
-            print("AI Response:", ai_response)
-            # Use regular expressions to extract the list of suggested words from the response
-            suggested_words = re.findall(r'"(\w+)"', ai_response)
-            # Filter out words that are already in the current list
-            new_suggested_words = [word for word in suggested_words if word not in words]
-            # Convert the list of new suggested words to JSON format
-            suggested_words_json = json.dumps(new_suggested_words, indent=2)
-            # Create a popup to display the suggested words in JSON format
-            suggest_window = tk.Toplevel(root)
-            suggest_window.title("AI Suggested Words")
-            suggest_text = tk.scrolledtext.ScrolledText(suggest_window, wrap=tk.WORD, font=("Helvetica", 12))
-            suggest_text.insert(tk.END, suggested_words_json)
-            suggest_text.pack(pady=10)
-            # Set the ScrolledText widget to read-only mode
-            suggest_text.configure(state='disabled')
-        except Exception as e:
-            # Debug information: Print the error message to the console
-            print("Error:", e)
-            messagebox.showerror("Error", "Failed to suggest words using AI.")
+        # Call the OpenAI Chat API through the rate-limited scheduler and show the result when it arrives
+        future = call_chat_completion(messages)
+        when_done([future], lambda: show_suggested_words(future, words))
+
+def show_suggested_words(future, words):
+    """Show the AI's suggested words that are not yet in the category in a popup."""
+    try:
+        # Extract the assistant's response
+        ai_response = future.result()['choices'][0]['message']['content']
+        # Debug information: Print the AI response to the console
+        print("AI Response:", ai_response)
+        # Use regular expressions to extract the list of suggested words from the response
+        suggested_words = re.findall(r'"(\w+)"', ai_response)
+        # Filter out words that are already in the current list
+        new_suggested_words = [word for word in suggested_words if word not in words]
+        # Convert the list of new suggested words to JSON format
+        suggested_words_json = json.dumps(new_suggested_words, indent=2)
+        # Create a popup to display the suggested words in JSON format
+        suggest_window = tk.Toplevel(root)
+        suggest_window.title("AI Suggested Words")
+        suggest_text = tk.scrolledtext.ScrolledText(suggest_window, wrap=tk.WORD, font=("Helvetica", 12))
+        suggest_text.insert(tk.END, suggested_words_json)
+        suggest_text.pack(pady=10)
+        # Set the ScrolledText widget to read-only mode
+        suggest_text.configure(state='disabled')
+    except Exception as e:
+        # Debug information: Print the error message to the console
+        print("Error:", e)
+        messagebox.showerror("Error", "Failed to suggest words using AI.")
 
 #Template
 
+def template_entry_ready():
+    """Return True if the Template Builder tab has been built, otherwise tell the user to open it."""
+    if template_entry is None:
+        messagebox.showerror("Error", "Open the Template Builder tab and enter a template first.")
+        return False
+    return True
+
 def clear_template_input():
     """Clear the content of the template input field."""
     global template_entry  # Access the global variable
@@ -614,38 +1249,60 @@ def auto_generate_template():
         {"role": "user", "content": f"Create a template that will be populated later from a list of words in that category for example you might generate something like this 'a [painting] of a [animal] [mood] at [landmark] during [time]' if my input was 'animals and famous places'. You can ONLY use categories from the reference, input: {current_template} reference of categories you are allowed to use and use '[]' not '{{}}'! Try to only respond with the template {category_types_explained}"}
     ]
 
-    # Call the OpenAI Chat API
-    try:
-        # Set the OpenAI API key
-        openai.api_key = os.environ.get("OPENAI_API_KEY")
+    # Call the OpenAI Chat API through the rate-limited scheduler
+    future = call_chat_completion(messages)
 
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=messages
-        )
+    def show_template():
+        try:
+            # Extract the assistant's response
+            generated_template = future.result()['choices'][0]['message']['content'].strip()
 
-        # Extract the assistant's response
-        generated_template = response['choices'][0]['message']['content'].strip()
+            # Replace the content of the template input box with the generated template
+            template_entry.delete("1.0", tk.END)
+            template_entry.insert(tk.END, generated_template)
+        except Exception as e:
+            print(f"Error: {e}")
+            template_entry.delete("1.0", tk.END)
+            template_entry.insert(tk.END, "Failed to generate template.")
 
-        # Replace the content of the template input box with the generated template
-        template_entry.delete("1.0", tk.END)
-        template_entry.insert(tk.END, generated_template)
-    except Exception as e:
-        print(f"Error: {e}")
-        template_entry.delete("1.0", tk.END)
-        template_entry.insert(tk.END, "Failed to generate template.")
+    # Show the template when the call has finished, without blocking the window
+    when_done([future], show_template)
 
 #Tabs
 
-def create_template_builder(tab_parent):
+def add_lazy_tab(tab_parent, text, build_tab):
+    """Add an empty tab whose contents are built by build_tab(frame) the first time it is viewed."""
+    tab = ttk.Frame(tab_parent)
+    tab_parent.add(tab, text=text)
+    unbuilt_tabs[str(tab)] = (tab, build_tab)
+    return tab
+
+def build_selected_tab(event):
+    """Build the contents of the selected tab if it has not been viewed before."""
+    unbuilt_tab = unbuilt_tabs.pop(event.widget.select(), None)
+    if unbuilt_tab:
+        tab, build_tab = unbuilt_tab
+        build_tab(tab)
+
+def report_startup_time():
+    """Print how long startup took and check it against STARTUP_TIME_BUDGET.
+
+    With PB_STARTUP_CHECK=1 the application exits right after startup, with status 1
+    if the budget was exceeded; check_startup.py runs this check (under xvfb-run without a display).
+    """
+    elapsed = time.perf_counter() - STARTUP_STARTED
+    within_budget = elapsed <= STARTUP_TIME_BUDGET
+    print(f'Startup took {elapsed * 1000:.0f} ms (budget {STARTUP_TIME_BUDGET * 1000:.0f} ms).')
+    if not within_budget:
+        print('Warning: startup exceeded its time budget.')
+    if os.environ.get("PB_STARTUP_CHECK") == "1":
+        root.destroy()
+        sys.exit(0 if within_budget else 1)
+
+def create_template_builder(tab):
     global tab_template_builder, template_entry  # Access the global variables
-    # Create a new tab for the Template Builder
-    tab_template_builder = ttk.Frame(tab_parent)
-    tab_parent.add(tab_template_builder, text="Template Builder")
-
-    # Load category types from JSON file
-    global CATEGORIES_BY_TYPE
-    CATEGORIES_BY_TYPE = load_category_types()
+    # The Template Builder tab is built the first time it is viewed
+    tab_template_builder = tab
 
     # Total number of categories
     total_categories = sum(len(categories) for categories in CATEGORIES_BY_TYPE.values())
@@ -696,11 +1353,23 @@ def create_template_builder(tab_parent):
     auto_generate_button = tk.Button(tab_template_builder, text="Auto Generate", command=auto_generate_template)
     auto_generate_button.grid(row=0, column=max(1, total_categories) + 1, padx=10, pady=10)
 
-def create_dictionary_tab(tab_parent):
-    # Create a new tab for the Dictionary
-    tab_dictionary = ttk.Frame(tab_parent)
-    tab_parent.add(tab_dictionary, text="Dictionary")
-    
+def create_dictionary_tab(tab_dictionary):
+    # The Dictionary tab is built the first time it is viewed
+
+    # Create a search box that looks up words across all categories as you type
+    global dictionary_search_entry, search_results_list
+    search_frame = tk.Frame(tab_dictionary)
+    search_frame.pack(side=tk.TOP, fill=tk.X)
+    tk.Label(search_frame, text="Search words:").pack(side=tk.TOP, anchor='w')
+    dictionary_search_entry = tk.Entry(search_frame)
+    dictionary_search_entry.pack(side=tk.TOP, fill=tk.X)
+    dictionary_search_entry.bind('<KeyRelease>', search_dictionary)
+
+    # Show the results as "word (category)"; double-click opens the category
+    search_results_list = VirtualList(search_frame, rows=8, format_item=lambda result: f"{result[0]}  ({result[1]})")
+    search_results_list.frame.pack(side=tk.TOP, fill=tk.X)
+    search_results_list.listbox.bind('<Double-Button-1>', open_search_result)
+
     # Create a Treeview to display the list of categories
     global category_treeview
     category_treeview = ttk.Treeview(tab_dictionary)
@@ -708,17 +1377,11 @@ def create_dictionary_tab(tab_parent):
     
     # Bind the selection event to load the selected category
     category_treeview.bind('<<TreeviewSelect>>', load_selected_category)
-    
-    # Load category types
-    category_types = load_category_types()
-    
-    # Populate the Treeview with the category types and categories
-    for category_type, categories in category_types.items():
-        # Insert the category type as a parent node
-        category_type_id = category_treeview.insert("", "end", text=category_type)
-        for category in categories:
-            # Insert the category as a child node of the category type
-            category_treeview.insert(category_type_id, "end", text=category)
+    # Insert the categories of a type when it is expanded
+    category_treeview.bind('<<TreeviewOpen>>', expand_category_type)
+
+    # Populate the Treeview with the category types of the shared vocabulary
+    populate_category_treeview()
 
     # Create an "Edit Types" button to open the edit types window
     edit_types_button = tk.Button(tab_dictionary, text="Edit Types", command=open_edit_types_window)
@@ -748,12 +1411,27 @@ def create_dictionary_tab(tab_parent):
     save_button = tk.Button(tab_dictionary, text="Save Changes", command=save_edited_json)
     save_button.pack()
 
-def create_history_tab(tab_parent):
+    # With overlays the editor shows the resolved words and saves into the top overlay
+    if VOCABULARY_OVERLAY_DIRS:
+        overlay_label = tk.Label(tab_dictionary, text=f"Saving to overlay: {VOCABULARY_OVERLAY_DIRS[-1]}")
+        overlay_label.pack()
+
+    # Create buttons to populate every category using GPT, or to try it against a local stub
+    ai_populate_all_button = tk.Button(tab_dictionary, text="AI Populate All", command=ai_populate_all)
+    ai_populate_all_button.pack()
+    ai_populate_dry_run_button = tk.Button(tab_dictionary, text="AI Populate All (Dry Run)", command=lambda: ai_populate_all(dry_run=True))
+    ai_populate_dry_run_button.pack()
+
+    # Create a label showing the progress of AI Populate All
+    global ai_populate_status
+    ai_populate_status = tk.Label(tab_dictionary, text="")
+    ai_populate_status.pack()
+
+def create_history_tab(tab):
     """Create the History tab."""
     global history_tab, search_entry, search_button, history_listbox  # Access the global variables
-    # Create a new tab for the History
-    history_tab = ttk.Frame(tab_parent)
-    tab_parent.add(history_tab, text="History")
+    # The History tab is built the first time it is viewed
+    history_tab = tab
 
     # Create the search entry
     search_entry = tk.Entry(history_tab)
@@ -784,6 +1462,9 @@ def create_history_tab(tab_parent):
 
 # Initialize tkinter variables after the root window is created
 combine_categories = tk.BooleanVar()
+balanced_sampling = tk.BooleanVar()
+balanced_category_sampling = tk.BooleanVar()
+distinct_words = tk.BooleanVar()
 
 # Initialize a list to store the labels for the generated prompts
 generated_prompt_labels = []
@@ -791,6 +1472,22 @@ generated_prompt_labels = []
 # Load the history from the JSON file
 template_history = load_history_from_json()
 
+# Load the shared vocabulary once for every tab
+load_vocabulary()
+
+# The word search index is built in the background once startup is done
+WORD_INDEX = WordIndex()
+
+# Pre-render prompts for the most-used templates in the background
+prompt_pool = PromptPool()
+
+# Schedule every AI call within the rate limits
+AI_SCHEDULER = AIScheduler(AI_REQUESTS_PER_MINUTE, AI_TOKENS_PER_MINUTE)
+bulk_populate_thread = None
+
+# Tabs that have not been viewed yet: tab widget name -> (tab, function that builds it)
+unbuilt_tabs = {}
+
 # Create a notebook (tab container)
 tab_parent = ttk.Notebook(root)
 tab_parent.pack(expand=1, fill='both')
@@ -807,20 +1504,57 @@ generate_button.pack(pady=10)
 generate_ai_button = tk.Button(tab_main, text="Generate (GPT)", command=generate_prompt_gpt)
 generate_ai_button.pack(pady=10)
 
+# Create a button to export prompts to a file (JSONL, CSV, text or SQLite)
+export_button = tk.Button(tab_main, text="Export...", command=export_generated_prompts)
+export_button.pack(pady=10)
+
+# Create a label showing the progress of the export
+export_status = tk.Label(tab_main, text="")
+export_status.pack()
+export_thread = None
+
 # Create a label and entry to input the number of prompts to generate
 num_prompts_label = tk.Label(tab_main, text="Number of prompts to generate:")
 num_prompts_label.pack()
 num_prompts_entry = tk.Entry(tab_main, textvariable=num_prompts_to_generate)
 num_prompts_entry.pack()
 
+# Create checkboxes for coverage-balanced sampling across a batch
+balanced_checkbox = tk.Checkbutton(tab_main, text="Balanced coverage", variable=balanced_sampling)
+balanced_checkbox.pack()
+balance_categories_checkbox = tk.Checkbutton(tab_main, text="Balance categories within a type", variable=balanced_category_sampling)
+balance_categories_checkbox.pack()
+
+# Create a checkbox and entry for sampling constraints
+distinct_checkbox = tk.Checkbutton(tab_main, text="Distinct words within a prompt", variable=distinct_words)
+distinct_checkbox.pack()
+exclude_words_label = tk.Label(tab_main, text="Exclude words (comma-separated):")
+exclude_words_label.pack()
+exclude_words_entry = tk.Entry(tab_main)
+exclude_words_entry.pack()
+implies_label = tk.Label(tab_main, text="Word implies category (word=category, comma-separated):")
+implies_label.pack()
+implies_entry = tk.Entry(tab_main)
+implies_entry.pack()
+
+# Build the remaining tabs the first time each one is viewed
+tab_parent.bind('<<NotebookTabChanged>>', build_selected_tab)
+
 # Create the Template Builder tab
-create_template_builder(tab_parent)
+add_lazy_tab(tab_parent, "Template Builder", create_template_builder)
 
 # Create the "Dictionary" tab
-create_dictionary_tab(tab_parent)
+add_lazy_tab(tab_parent, "Dictionary", create_dictionary_tab)
 
 # Create the History tab
-create_history_tab(tab_parent)  # Added this line to create the History tab
+add_lazy_tab(tab_parent, "History", create_history_tab)
+
+# Measure startup once the window has been drawn
+root.after_idle(report_startup_time)
+
+# Start building the word search index and pre-rendering prompts once startup is done
+root.after_idle(schedule_word_index)
+root.after_idle(prompt_pool.start)
 
 # Run the application
 root.mainloop()
\ No newline at end of file
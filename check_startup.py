@@ -0,0 +1,37 @@
+import os
+import shutil
+import subprocess
+import sys
+
+# Launch PB.py in startup check mode and fail if startup exceeds STARTUP_TIME_BUDGET.
+# Without a display the check runs under xvfb-run (e.g. on a CI machine).
+
+# Maximum time in seconds to wait for the application to start and exit
+CHECK_TIMEOUT = 60
+
+
+def main():
+    """Run the startup check and return its exit status."""
+    # PB.py loads jsons/ and the history relative to the working directory
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, "PB.py"]
+    if not os.environ.get("DISPLAY"):
+        if shutil.which("xvfb-run") is None:
+            print("Error: no display available and xvfb-run is not installed.")
+            return 2
+        command = ["xvfb-run", "-a"] + command
+    environment = dict(os.environ, PB_STARTUP_CHECK="1")
+    try:
+        result = subprocess.run(command, cwd=repo_dir, env=environment, timeout=CHECK_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        print(f"Error: the application did not finish starting within {CHECK_TIMEOUT} seconds.")
+        return 1
+    if result.returncode == 0:
+        print("Startup is within its time budget.")
+    else:
+        print("Error: startup check failed.")
+    return result.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,744 @@
+import abc
+import bisect
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from functools import partial
+from types import MappingProxyType
+
+# zstd compression for output sinks is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The vocabulary, sampling, output sink and search code used by PB.py.
+# Nothing here creates Tk widgets, so it can be imported (and tested) without a display.
+
+# Define the name of the subdirectory where JSON files are stored
+JSON_DIR = "jsons"
+
+# JSON files in JSON_DIR that are not word lists
+NON_CATEGORY_FILES = {'category_types.json', 'category_types_explained.json'}
+
+# Maximum number of results shown by the dictionary search
+SEARCH_RESULT_LIMIT = 500
+
+# Number of compiled templates kept in the LRU cache
+COMPILED_TEMPLATE_CACHE_SIZE = 64
+
+# Output sink settings: write buffer size in bytes and number of prompts per batched write
+SINK_BUFFER_SIZE = 1024 * 1024
+SINK_BATCH_SIZE = 10000
+
+# Every snapshot gets a new version number; resolved snapshots are cached per (base, overlays)
+vocabulary_versions = itertools.count(1)
+resolved_vocabularies = {}
+
+# Compiled templates, most recently used last
+compiled_templates = OrderedDict()
+compiled_templates_lock = threading.Lock()
+
+#Vocabulary
+
+def load_words(category, directory=None):
+    """Load words from JSON file for the given category."""
+    # Build the file path using the JSON_DIR constant unless another directory is given
+    file_path = os.path.join(directory or JSON_DIR, f'{category}.json')
+    try:
+        with open(file_path, 'r') as file:
+            words = json.load(file)
+        return words
+    except FileNotFoundError:
+        print(f'Error: JSON file for category "{category}" not found.')
+    except json.JSONDecodeError as e:
+        print(f'Error: JSON file for category "{category}" contains invalid JSON. {e}')
+    except UnicodeDecodeError as e:
+        print(f'Error: JSON file for category "{category}" could not be decoded. {e}')
+    return []
+
+def is_word_list(words):
+    """Return True if the value is a list of strings (the format of a category JSON file)."""
+    return isinstance(words, list) and all(isinstance(word, str) for word in words)
+
+def load_category_types(directory=None):
+    """Load category types from JSON file or prompt user for default category types."""
+    # Build the file path using the JSON_DIR constant unless another directory is given
+    file_path = os.path.join(directory or JSON_DIR, 'category_types.json')
+    try:
+        with open(file_path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        print('Error: Unable to load category types. JSON file not found.')
+        # Prompt user for default category types
+        default_category_types = input("Enter default category types separated by comma (e.g., uncategorized,nouns): ").strip()
+        # Convert input to dictionary format and remove extra spaces
+        default_categories_dict = {category_type.strip(): [] for category_type in default_category_types.split(',')}
+        # Write the default categories to a new JSON file
+        with open(file_path, 'w') as file:
+            json.dump(default_categories_dict, file, indent=2)
+        return default_categories_dict
+    except json.JSONDecodeError as e:
+        print(f'Error: Unable to load category types. Invalid JSON. {e}')
+    return {'uncategorized': [], 'nouns': []}
+
+class VocabularySnapshot:
+    """An immutable view of the vocabulary: category types plus category words, loaded on first use and cached.
+
+    Category types and words are tuples, so snapshots layered on top of each other can
+    share every category they do not change instead of copying it.
+    """
+
+    def __init__(self, category_types, load_category_words, has_category):
+        self.category_types = MappingProxyType({
+            category_type: tuple(categories) for category_type, categories in category_types.items()
+        })
+        self.version = next(vocabulary_versions)
+        self.load_category_words = load_category_words
+        self.has_category = has_category
+        self.cache = {}
+
+    def words(self, category):
+        """Return the words of a category, loading them the first time they are needed."""
+        words = self.cache.get(category)
+        if words is None:
+            words = self.cache[category] = tuple(self.load_category_words(category))
+        return words
+
+# Keys allowed in an overlay edit object
+OVERLAY_EDIT_KEYS = ('replace', 'remove', 'add')
+
+def is_overlay_edit(edit):
+    """Return True if the value is a valid overlay edit: a list of strings, or an object of such lists."""
+    if isinstance(edit, dict):
+        return set(edit) <= set(OVERLAY_EDIT_KEYS) and all(is_word_list(value) for value in edit.values())
+    return is_word_list(edit)
+
+def replaces_all(edit):
+    """Return True if an overlay edit does not depend on the values below it."""
+    return isinstance(edit, list) or 'replace' in edit
+
+def apply_overlay_edit(values, edit):
+    """Apply an overlay edit to a tuple: a list replaces it, a dict may hold "replace", "remove" and "add" lists."""
+    if isinstance(edit, list):
+        return tuple(edit)
+    values = tuple(edit.get('replace', values))
+    removed = set(edit.get('remove', ()))
+    if removed:
+        values = tuple(value for value in values if value not in removed)
+    existing = set(values)
+    added = tuple(dict.fromkeys(value for value in edit.get('add', ()) if value not in existing))
+    return values + added if added else values
+
+def load_overlay_file(file_path):
+    """Load one overlay JSON file, returning None if it is invalid."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            edit = json.load(file)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f'Error: Overlay file "{file_path}" could not be loaded. {e}')
+        return None
+    if not isinstance(edit, (list, dict)):
+        print(f'Error: Overlay file "{file_path}" must contain a list or an object.')
+        return None
+    return edit
+
+def overlay_edit_or_none(edit, source):
+    """Return the edit if it is valid, otherwise report it and return None."""
+    if is_overlay_edit(edit):
+        return edit
+    print(f'Error: Overlay entry {source} must be a list of strings or an object with '
+          f'{", ".join(OVERLAY_EDIT_KEYS)} lists of strings. It was ignored.')
+    return None
+
+def overlay_vocabulary(parent, overlay_dir):
+    """Layer the edits in an overlay directory on top of a parent snapshot.
+
+    <category>.json edits the words of a category and category_types.json edits the
+    category types (a null type removes it). Categories the overlay does not edit are
+    returned from the parent, so the same tuples are shared by both snapshots. A category
+    whose overlay file is rejected keeps the parent's words, or has none if only the overlay has it.
+    """
+    edits = {}
+    # Categories whose overlay file was rejected (already reported when it was loaded)
+    rejected = set()
+    for name in sorted(os.listdir(overlay_dir)):
+        if name.endswith('.json') and name not in NON_CATEGORY_FILES:
+            file_path = os.path.join(overlay_dir, name)
+            edit = load_overlay_file(file_path)
+            if edit is not None and overlay_edit_or_none(edit, f'"{file_path}"') is not None:
+                edits[os.path.splitext(name)[0]] = edit
+            else:
+                rejected.add(os.path.splitext(name)[0])
+
+    category_types = dict(parent.category_types)
+    types_path = os.path.join(overlay_dir, 'category_types.json')
+    type_edits = load_overlay_file(types_path) if os.path.exists(types_path) else None
+    if type_edits is not None and not isinstance(type_edits, dict):
+        print(f'Error: Overlay file "{types_path}" must contain an object. It was ignored.')
+        type_edits = None
+    for category_type, edit in (type_edits or {}).items():
+        if edit is None:
+            category_types.pop(category_type, None)
+        elif overlay_edit_or_none(edit, f'"{category_type}" in "{types_path}"') is not None:
+            category_types[category_type] = apply_overlay_edit(category_types.get(category_type, ()), edit)
+
+    def load_category_words(category):
+        edit = edits.get(category)
+        if edit is None:
+            if category in rejected:
+                if not parent.has_category(category):
+                    # Not reported as missing: the rejected overlay file was reported instead
+                    return ()
+                print(f'Using the words below overlay "{overlay_dir}" for category "{category}", '
+                      f'since its overlay file was ignored.')
+            return parent.words(category)
+        # Categories the overlay replaces or creates never touch the parent
+        below = () if replaces_all(edit) or not parent.has_category(category) else parent.words(category)
+        return apply_overlay_edit(below, edit)
+
+    def has_category(category):
+        return category in edits or category in rejected or parent.has_category(category)
+
+    return VocabularySnapshot(category_types, load_category_words, has_category)
+
+def resolve_vocabulary(base_dir=None, overlay_dirs=(), reload=False):
+    """Return the snapshot of a base directory with overlay directories applied in order.
+
+    Snapshots are cached per layer, so overlays sharing a base (or a prefix of overlays)
+    share the snapshots below them. reload drops the cached snapshots of the base directory.
+    """
+    base_dir = base_dir or JSON_DIR
+    overlay_dirs = tuple(overlay_dirs)
+    if reload:
+        for key in [key for key in resolved_vocabularies if key[0] == base_dir]:
+            del resolved_vocabularies[key]
+    key = (base_dir, overlay_dirs)
+    snapshot = resolved_vocabularies.get(key)
+    if snapshot is None:
+        if overlay_dirs:
+            parent = resolve_vocabulary(base_dir, overlay_dirs[:-1])
+            snapshot = overlay_vocabulary(parent, overlay_dirs[-1])
+        else:
+            snapshot = VocabularySnapshot(
+                load_category_types(base_dir),
+                partial(load_words, directory=base_dir),
+                lambda category: os.path.exists(os.path.join(base_dir, f'{category}.json'))
+            )
+        resolved_vocabularies[key] = snapshot
+    return snapshot
+
+#Prompt Creation
+
+# Placeholders are category types, categories or slash-separated category combinations,
+# optionally followed by a link tag (e.g. [animal#1]) that makes every slot with the same tag reuse one draw
+PLACEHOLDER_PATTERN = re.compile(r'\[([\w/-]+)(#\w+)?\]')
+
+class SamplingConstraints:
+    """Constraints applied while sampling, so prompts never have to be filtered and re-rendered.
+
+    distinct: no word appears twice in one prompt (linked slots still share their word).
+    exclude: words (case-insensitive) that are never drawn.
+    implies: word -> category; once the word is drawn, later slots that can draw from
+    the category draw only from it.
+    """
+
+    def __init__(self, distinct=False, exclude=(), implies=None):
+        self.distinct = distinct
+        self.exclude = frozenset(word.lower() for word in exclude)
+        self.implies = {word.lower(): category for word, category in (implies or {}).items()}
+
+    def key(self):
+        """Return a hashable key identifying these constraints."""
+        return (self.distinct, self.exclude, frozenset(self.implies.items()))
+
+# Sampling without any constraints
+NO_CONSTRAINTS = SamplingConstraints()
+
+def parse_implied_categories(text):
+    """Parse comma-separated word=category rules into a dict, raising ValueError for a malformed rule."""
+    implies = {}
+    for rule in text.split(','):
+        if not rule.strip():
+            continue
+        word, separator, category = (part.strip() for part in rule.partition('='))
+        if not separator or not word or not category:
+            raise ValueError(f'"{rule.strip()}" is not a word=category rule.')
+        implies[word] = category
+    return implies
+
+def choose_unused(rng, words, blocked):
+    """Uniformly choose a word whose position is not in the sorted blocked positions, without retrying."""
+    # Draw among the free positions, then step over the blocked ones at or before the draw
+    index = rng.randrange(len(words) - len(blocked))
+    for position in blocked:
+        if position > index:
+            break
+        index += 1
+    return words[index]
+
+class CompiledTemplate:
+    """A template split into literal text and slots, with the words of every slot category loaded once."""
+
+    def __init__(self, template, vocabulary, constraints=NO_CONSTRAINTS):
+        self.template = template
+        self.id = template_id(template)
+        self.constraints = constraints
+        # Literal text around the slots: parts[i] comes before slots[i], parts[-1] after the last slot
+        self.parts = []
+        # Each slot is (placeholder, tuple of candidate categories, link tag or None)
+        self.slots = []
+        self.words = {}
+        # Category -> {word: position}, used to skip words already in the prompt
+        self.positions = {}
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(template):
+            placeholder, link = match.groups()
+            if placeholder in vocabulary.category_types:
+                # A category type draws from any of its categories
+                categories = tuple(vocabulary.category_types[placeholder])
+            else:
+                # Split combined categories into a list
+                categories = tuple(placeholder.split('/'))
+            self.parts.append(template[position:match.start()])
+            self.slots.append((placeholder + (link or ''), categories, link and placeholder + link))
+            position = match.end()
+        self.parts.append(template[position:])
+        # Load each category's words once for the whole compiled template
+        for _, categories, _ in self.slots:
+            for category in categories:
+                if category not in self.words:
+                    self.words[category] = self.constrained_words(vocabulary.words(category))
+        if constraints.distinct:
+            self.positions = {
+                category: {word: index for index, word in enumerate(words)}
+                for category, words in self.words.items()
+            }
+
+    def constrained_words(self, words):
+        """Apply the exclusions (and de-duplication for distinct draws) to a category's words once, at compile time."""
+        if self.constraints.exclude:
+            words = tuple(word for word in words if word.lower() not in self.constraints.exclude)
+        if self.constraints.distinct:
+            words = tuple(dict.fromkeys(words))
+        return words
+
+    def render(self, sampler):
+        """Fill the slots using the sampler and return the prompt and the (placeholder, category, word) per slot."""
+        pieces = [self.parts[0]]
+        chosen = []
+        # Words used so far (only tracked for distinct draws), draws of linked slots and implied categories
+        used = set() if self.constraints.distinct else None
+        linked = {}
+        implied = set()
+        for (placeholder, categories, link), part in zip(self.slots, self.parts[1:]):
+            if link in linked:
+                category, word = linked[link]
+            else:
+                if implied:
+                    categories = tuple(category for category in categories if category in implied) or categories
+                category, word = sampler.draw(self, categories, used)
+                if link:
+                    linked[link] = (category, word)
+                if used is not None and word:
+                    used.add(word)
+                implied_category = self.constraints.implies.get(word.lower())
+                if implied_category:
+                    implied.add(implied_category)
+            pieces.append(word)
+            pieces.append(part)
+            chosen.append((placeholder, category, word))
+        return ''.join(pieces), chosen
+
+    def blocked_positions(self, category, used):
+        """Return the sorted positions of the used words in a category."""
+        positions = self.positions[category]
+        return sorted(positions[word] for word in used if word in positions)
+
+class RandomSampler:
+    """Independent draws: a uniformly random category, then a uniformly random word from it."""
+
+    def __init__(self, rng=random):
+        self.rng = rng
+
+    def draw(self, compiled, categories, used=None):
+        if not categories:
+            return '', ''
+        if not used:
+            category = self.rng.choice(categories)
+            words = compiled.words[category]
+            return category, self.rng.choice(words) if words else ''
+        # Choose among the categories that still have unused words, then among their unused words
+        blocked = {category: compiled.blocked_positions(category, used) for category in categories}
+        available = [category for category in categories if len(compiled.words[category]) > len(blocked[category])]
+        if not available:
+            return categories[0], ''
+        category = self.rng.choice(available)
+        return category, choose_unused(self.rng, compiled.words[category], blocked[category])
+
+class CoverageSampler:
+    """Coverage-balanced draws from shuffled decks, reshuffled when empty, so words are used evenly.
+
+    Decks are kept per slot (keyed by its candidate categories) and shared by every prompt
+    drawn from this sampler, so a batch uses every word once before any word repeats.
+    With balance_categories the slot first deals a category from a deck of its categories
+    and then a word from that category's deck; otherwise all words of the slot share one deck.
+    A sampler is meant for one compiled template (or templates with the same constraints).
+    """
+
+    def __init__(self, rng=random, balance_categories=False):
+        self.rng = rng
+        self.balance_categories = balance_categories
+        # Deck key -> [cards, position of the next card]
+        self.decks = {}
+
+    def deal(self, key, make_cards, skip=None):
+        """Return the next card of a deck, building it on first use and reshuffling when it runs out.
+
+        Cards for which skip(card) is true are passed over by swapping the next usable card
+        forward, so skipping costs at most one step per skipped card and never redraws.
+        """
+        deck = self.decks.get(key)
+        if deck is None:
+            deck = self.decks[key] = [make_cards(), 0]
+            self.rng.shuffle(deck[0])
+        cards = deck[0]
+        if not cards:
+            return None
+        if deck[1] == len(cards):
+            self.rng.shuffle(cards)
+            deck[1] = 0
+        position = deck[1]
+        if skip is not None:
+            for index in range(position, len(cards)):
+                if not skip(cards[index]):
+                    cards[position], cards[index] = cards[index], cards[position]
+                    break
+            else:
+                # Every card left in this round is skipped: repeat a usable card from earlier in the round
+                return next((card for card in cards[:position] if not skip(card)), None)
+        deck[1] += 1
+        return cards[position]
+
+    def draw(self, compiled, categories, used=None):
+        if not categories:
+            return '', ''
+        words_by_category = compiled.words
+        if self.balance_categories:
+            skip_word = used.__contains__ if used else None
+            skip_category = None
+            if used:
+                # Pass over categories whose words are all used in this prompt
+                skip_category = lambda category: (
+                    len(compiled.blocked_positions(category, used)) == len(words_by_category[category])
+                )
+            category = self.deal(('categories', categories), lambda: list(categories), skip_category)
+            if category is None:
+                return categories[0], ''
+            word = self.deal(('words', category), lambda: list(words_by_category[category]), skip_word)
+            return category, word or ''
+        skip_card = (lambda card: card[1] in used) if used else None
+        card = self.deal(('pool', categories), lambda: [
+            (category, word) for category in dict.fromkeys(categories) for word in words_by_category[category]
+        ], skip_card)
+        return card or (categories[0], '')
+
+def compile_template(template, vocabulary, constraints=NO_CONSTRAINTS):
+    """Return the compiled template from the LRU cache, compiling it on a miss.
+
+    Entries are keyed by template text, vocabulary snapshot version and constraints,
+    so a new snapshot never reuses templates compiled against an older one.
+    """
+    key = (template, vocabulary.version, constraints.key())
+    with compiled_templates_lock:
+        compiled = compiled_templates.get(key)
+        if compiled is not None:
+            compiled_templates.move_to_end(key)
+            return compiled
+    compiled = CompiledTemplate(template, vocabulary, constraints)
+    with compiled_templates_lock:
+        compiled_templates[key] = compiled
+        while len(compiled_templates) > COMPILED_TEMPLATE_CACHE_SIZE:
+            compiled_templates.popitem(last=False)
+    return compiled
+
+def create_sampler(balanced=False, balance_categories=False, rng=random):
+    """Create the sampler for a batch: coverage-balanced decks or independent random draws."""
+    if balanced:
+        return CoverageSampler(rng, balance_categories)
+    return RandomSampler(rng)
+
+#Output Sinks
+
+def template_id(template):
+    """Return a stable identifier for a template (CRC32 of its text as hex)."""
+    return f'{zlib.crc32(template.encode("utf-8")):08x}'
+
+def infer_compression(path):
+    """Infer the compression to use from the file extension ('gzip', 'zstd' or None)."""
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def open_sink_stream(path, compression=None):
+    """Open a buffered text stream for writing, optionally with streaming compression."""
+    # Rows are written one batch at a time, so the compressors see large writes
+    if compression == 'gzip':
+        # A low compression level keeps gzip from becoming the bottleneck
+        return gzip.open(path, 'wt', compresslevel=1, encoding='utf-8', newline='')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd compression requires the "zstandard" package.')
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    if compression is not None:
+        raise ValueError(f'Unknown compression "{compression}".')
+    return open(path, 'w', encoding='utf-8', newline='', buffering=SINK_BUFFER_SIZE)
+
+class PromptSink(abc.ABC):
+    """Base class for prompt sinks: buffers rows and writes them out in batches."""
+
+    def __init__(self, batch_size=SINK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, prompt, template_id=None, seed=None, index=None, slots=()):
+        """Queue one prompt with its metadata, flushing when the batch is full."""
+        self.rows.append((prompt, template_id, seed, index, slots))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all queued rows to the underlying storage."""
+        if self.rows:
+            self.write_rows(self.rows)
+            self.rows = []
+
+    @abc.abstractmethod
+    def write_rows(self, rows):
+        """Write a batch of (prompt, template_id, seed, index, slots) rows."""
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class StreamSink(PromptSink):
+    """Sink that formats each batch into one string and writes it to a text stream."""
+
+    def __init__(self, path, compression=None, batch_size=SINK_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.stream = open_sink_stream(path, compression)
+
+    def write_rows(self, rows):
+        self.stream.write(''.join(self.format_row(row) for row in rows))
+
+    @abc.abstractmethod
+    def format_row(self, row):
+        """Return one row formatted as text, including its line ending."""
+
+    def close(self):
+        super().close()
+        self.stream.close()
+
+class LinesSink(StreamSink):
+    """Write one prompt per line, without metadata."""
+
+    def format_row(self, row):
+        # Keep one prompt per line even if a word contains a newline
+        return row[0].replace('\n', ' ') + '\n'
+
+class JsonlSink(StreamSink):
+    """Write one JSON object per line with the prompt and its metadata."""
+
+    def format_row(self, row):
+        prompt, template_id, seed, index, slots = row
+        return json.dumps({
+            "prompt": prompt,
+            "template_id": template_id,
+            "seed": seed,
+            "index": index,
+            "slots": [{"placeholder": p, "category": c, "word": w} for p, c, w in slots],
+        }, ensure_ascii=False) + '\n'
+
+class CsvSink(PromptSink):
+    """Write prompts as CSV with template id, seed, index and the chosen words (as JSON) in columns."""
+
+    HEADER = ('prompt', 'template_id', 'seed', 'index', 'slots')
+
+    def __init__(self, path, compression=None, batch_size=SINK_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.stream = open_sink_stream(path, compression)
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(self.HEADER)
+
+    def write_rows(self, rows):
+        self.writer.writerows(
+            (prompt, template_id, seed, index, json.dumps([list(slot) for slot in slots], ensure_ascii=False))
+            for prompt, template_id, seed, index, slots in rows
+        )
+
+    def close(self):
+        super().close()
+        self.stream.close()
+
+class SqliteSink(PromptSink):
+    """Write prompts into a SQLite table, one transaction per batch."""
+
+    def __init__(self, path, table='prompts', batch_size=SINK_BATCH_SIZE):
+        super().__init__(batch_size)
+        if not re.fullmatch(r'\w+', table):
+            raise ValueError(f'Invalid table name "{table}".')
+        self.table = table
+        self.connection = sqlite3.connect(path)
+        # Bulk loading does not need per-transaction durability
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (prompt TEXT, template_id TEXT, seed INTEGER, "index" INTEGER, slots TEXT)'
+        )
+
+    def write_rows(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO {self.table} (prompt, template_id, seed, "index", slots) VALUES (?, ?, ?, ?, ?)',
+                ((prompt, template_id, seed, index, json.dumps([list(slot) for slot in slots], ensure_ascii=False))
+                 for prompt, template_id, seed, index, slots in rows)
+            )
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+# Map file extensions to sink classes
+SINKS_BY_EXTENSION = {
+    '.jsonl': JsonlSink,
+    '.csv': CsvSink,
+    '.txt': LinesSink,
+    '.db': SqliteSink,
+    '.sqlite': SqliteSink,
+}
+
+def create_sink(path, compression=None, batch_size=SINK_BATCH_SIZE):
+    """Create a sink for the given path, choosing the format and compression from its extension."""
+    if compression is None:
+        compression = infer_compression(path)
+    # Strip the compression extension to find the format extension
+    base_path = path[:-3] if path.endswith('.gz') else path[:-4] if path.endswith('.zst') else path
+    sink_class = SINKS_BY_EXTENSION.get(os.path.splitext(base_path)[1].lower())
+    if sink_class is None:
+        raise ValueError(f'No sink for "{path}". Use one of: {", ".join(SINKS_BY_EXTENSION)}.')
+    if sink_class is SqliteSink:
+        if compression:
+            raise ValueError('SQLite sinks cannot be compressed.')
+        return SqliteSink(path, batch_size=batch_size)
+    return sink_class(path, compression, batch_size)
+
+def export_prompts(compiled, count, sink, seed=None, balanced=False, balance_categories=False, progress=None):
+    """Generate count prompts from a compiled template into the sink.
+
+    The whole batch draws from one random generator seeded with the batch seed, so the
+    generator is seeded once rather than per prompt. Every row records the batch seed and
+    its index in the batch, which is enough to reproduce it with reproduce_prompt.
+    progress, if given, is a dict whose "done" entry is updated after every batch.
+    """
+    batch_seed = random.Random(seed).getrandbits(63)
+    sampler = create_sampler(balanced, balance_categories, random.Random(batch_seed))
+    for index in range(count):
+        prompt, slots = compiled.render(sampler)
+        sink.write(prompt, compiled.id, batch_seed, index, slots)
+        if progress is not None and index % SINK_BATCH_SIZE == 0:
+            progress["done"] = index
+    sink.flush()
+    if progress is not None:
+        progress["done"] = count
+
+def reproduce_prompt(compiled, seed, index, balanced=False, balance_categories=False):
+    """Return the (prompt, slots) exported at index of the batch with the given batch seed.
+
+    The batch is replayed up to the row, so the compiled template (vocabulary and constraints)
+    and the sampling options must match the export.
+    """
+    sampler = create_sampler(balanced, balance_categories, random.Random(seed))
+    for _ in range(index):
+        compiled.render(sampler)
+    return compiled.render(sampler)
+
+#Search
+
+class WordIndex:
+    """Inverted index from words (and each token of multi-word entries) to the categories holding them.
+
+    Keys are lowercased and kept in a sorted list, so a prefix search is a binary search
+    followed by a scan over the matching range only.
+    """
+
+    def __init__(self):
+        # Lowercased key -> set of (word, category)
+        self.entries = {}
+        # Category -> keys added for it, so a category can be re-indexed on its own
+        self.keys_by_category = {}
+        self.sorted_keys = []
+        self.dirty = False
+
+    @staticmethod
+    def keys_for(word):
+        """Return the index keys for a word: the whole word and each of its tokens."""
+        word = word.lower()
+        return {word, *re.split(r'[\s/-]+', word)} - {''}
+
+    def add_category(self, category, words):
+        """Index the words of a category, replacing anything indexed for it before."""
+        self.remove_category(category)
+        category_keys = set()
+        for word in words:
+            if not isinstance(word, str):
+                continue
+            for key in self.keys_for(word):
+                self.entries.setdefault(key, set()).add((word, category))
+                category_keys.add(key)
+        self.keys_by_category[category] = category_keys
+        self.dirty = True
+
+    def remove_category(self, category):
+        """Remove all words of a category from the index."""
+        for key in self.keys_by_category.pop(category, ()):
+            entry = self.entries[key]
+            entry.difference_update([pair for pair in entry if pair[1] == category])
+            if not entry:
+                del self.entries[key]
+        self.dirty = True
+
+    def search(self, text, limit=SEARCH_RESULT_LIMIT):
+        """Return up to limit (word, category) pairs whose word or one of its tokens starts with text."""
+        prefix = text.strip().lower()
+        if not prefix:
+            return []
+        if self.dirty:
+            self.sorted_keys = sorted(self.entries)
+            self.dirty = False
+        results = {}
+        for position in range(bisect.bisect_left(self.sorted_keys, prefix), len(self.sorted_keys)):
+            key = self.sorted_keys[position]
+            if not key.startswith(prefix):
+                break
+            for pair in sorted(self.entries[key]):
+                results[pair] = None
+            if len(results) >= limit:
+                break
+        return list(results)[:limit]
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The application modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pb_core import resolve_vocabulary
+
+
+def write_json(directory, name, data):
+    """Write data as JSON to directory/name."""
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+
+
+@pytest.fixture
+def write_vocabulary(tmp_path):
+    """Return a function that writes a vocabulary (and overlays) to disk and returns (base_dir, overlay_dirs).
+
+    Overlays are dicts of file name -> JSON data, applied in order on top of the base directory.
+    """
+    counter = iter(range(1000))
+
+    def write(category_types, words_by_category, overlays=()):
+        directory = tmp_path / f'base{next(counter)}'
+        directory.mkdir()
+        write_json(directory, 'category_types.json', category_types)
+        for category, words in words_by_category.items():
+            write_json(directory, f'{category}.json', words)
+        overlay_dirs = []
+        for overlay in overlays:
+            overlay_dir = tmp_path / f'overlay{next(counter)}'
+            overlay_dir.mkdir()
+            for name, data in overlay.items():
+                write_json(overlay_dir, name, data)
+            overlay_dirs.append(str(overlay_dir))
+        return str(directory), tuple(overlay_dirs)
+
+    return write
+
+
+@pytest.fixture
+def make_vocabulary(write_vocabulary):
+    """Return a function that writes a vocabulary (and overlays) to disk and resolves its snapshot."""
+
+    def make(category_types, words_by_category, overlays=()):
+        return resolve_vocabulary(*write_vocabulary(category_types, words_by_category, overlays))
+
+    return make
@@ -0,0 +1,117 @@
+import random
+from collections import Counter
+
+import pytest
+
+from pb_core import (
+    NO_CONSTRAINTS, CompiledTemplate, CoverageSampler, RandomSampler, SamplingConstraints,
+    choose_unused, compile_template, parse_implied_categories
+)
+
+ANIMALS = [f'animal{index:02d}' for index in range(50)]
+
+
+def render_many(compiled, sampler, count):
+    """Render count prompts and return the list of words chosen per prompt."""
+    return [[word for _, _, word in compiled.render(sampler)[1]] for _ in range(count)]
+
+
+def test_template_is_split_into_parts_and_slots(make_vocabulary):
+    vocabulary = make_vocabulary({'creature': ['animal']}, {'animal': ['cat']})
+    compiled = CompiledTemplate('A [creature] and a [animal/animal]!', vocabulary)
+    assert compiled.parts == ['A ', ' and a ', '!']
+    assert [categories for _, categories, _ in compiled.slots] == [('animal',), ('animal', 'animal')]
+    assert compiled.render(RandomSampler())[0] == 'A cat and a cat!'
+
+
+def test_compile_template_is_cached_per_vocabulary_version(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ['cat']})
+    compiled = compile_template('[animal]', vocabulary)
+    assert compile_template('[animal]', vocabulary) is compiled
+    assert compile_template('[animal]', make_vocabulary({}, {'animal': ['cat']})) is not compiled
+
+
+def test_coverage_sampler_uses_every_word_once_per_round(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ANIMALS})
+    compiled = CompiledTemplate('[animal] and [animal]', vocabulary)
+    sampler = CoverageSampler(random.Random(1))
+    # Both slots draw from one deck, so 25 prompts deal all 50 words exactly once
+    first_round = [word for words in render_many(compiled, sampler, 25) for word in words]
+    assert sorted(first_round) == ANIMALS
+    # The deck is reshuffled when it runs out and the next round covers every word again
+    second_round = [word for words in render_many(compiled, sampler, 25) for word in words]
+    assert sorted(second_round) == ANIMALS
+    assert second_round != first_round
+
+
+def test_coverage_sampler_balances_categories(make_vocabulary):
+    vocabulary = make_vocabulary(
+        {'creature': ['bird', 'animal']}, {'bird': ['owl'], 'animal': ANIMALS[:9]}
+    )
+    compiled = CompiledTemplate('[creature]', vocabulary)
+    # Without balancing every word is one card, so the one-word category is dealt 1 time in 10
+    sampler = CoverageSampler(random.Random(2))
+    counts = Counter(compiled.render(sampler)[1][0][1] for _ in range(100))
+    assert counts == {'bird': 10, 'animal': 90}
+    # With balancing the categories are dealt evenly
+    sampler = CoverageSampler(random.Random(2), balance_categories=True)
+    counts = Counter(compiled.render(sampler)[1][0][1] for _ in range(100))
+    assert counts == {'bird': 50, 'animal': 50}
+
+
+def test_coverage_sampler_skips_forward_over_used_words(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ANIMALS[:3]})
+    compiled = CompiledTemplate('[animal] [animal]', vocabulary, SamplingConstraints(distinct=True))
+    sampler = CoverageSampler(random.Random(3))
+    prompts = render_many(compiled, sampler, 300)
+    # No prompt repeats a word, and skipping never redraws, so usage stays even
+    assert all(len(set(words)) == 2 for words in prompts)
+    counts = Counter(word for words in prompts for word in words)
+    assert max(counts.values()) - min(counts.values()) <= len(prompts) // 10
+
+
+def test_coverage_sampler_returns_empty_word_when_every_word_is_used(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ['cat']})
+    compiled = CompiledTemplate('[animal] [animal]', vocabulary, SamplingConstraints(distinct=True))
+    for sampler in (CoverageSampler(random.Random(4)), CoverageSampler(random.Random(4), True), RandomSampler()):
+        assert compiled.render(sampler)[0] == 'cat '
+
+
+def test_choose_unused_never_returns_a_blocked_position():
+    words = ['a', 'b', 'c', 'd', 'e']
+    rng = random.Random(5)
+    chosen = Counter(choose_unused(rng, words, [0, 2, 4]) for _ in range(1000))
+    assert set(chosen) == {'b', 'd'}
+
+
+def test_distinct_and_exclude_constraints(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ['cat', 'Dog', 'owl']})
+    constraints = SamplingConstraints(distinct=True, exclude=['dog'])
+    compiled = CompiledTemplate('[animal] [animal]', vocabulary, constraints)
+    for words in render_many(compiled, RandomSampler(random.Random(6)), 100):
+        assert sorted(words) == ['cat', 'owl']
+
+
+def test_linked_slots_reuse_one_draw(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': ANIMALS})
+    compiled = CompiledTemplate('[animal#1] chases [animal] and [animal#1]', vocabulary, NO_CONSTRAINTS)
+    for words in render_many(compiled, RandomSampler(random.Random(7)), 100):
+        assert words[0] == words[2]
+
+
+def test_implied_category_restricts_later_slots(make_vocabulary):
+    vocabulary = make_vocabulary(
+        {'place': ['sea', 'land']}, {'animal': ['shark'], 'sea': ['reef'], 'land': ['field', 'forest']}
+    )
+    constraints = SamplingConstraints(implies={'Shark': 'sea'})
+    compiled = CompiledTemplate('a [animal] in the [place]', vocabulary, constraints)
+    for words in render_many(compiled, RandomSampler(random.Random(8)), 50):
+        assert words == ['shark', 'reef']
+
+
+def test_parse_implied_categories():
+    assert parse_implied_categories(' shark = sea, camel=desert ,') == {'shark': 'sea', 'camel': 'desert'}
+    assert parse_implied_categories('') == {}
+    for text in ('shark', 'shark=', '=sea'):
+        with pytest.raises(ValueError):
+            parse_implied_categories(text)
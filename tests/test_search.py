@@ -0,0 +1,26 @@
+from pb_core import WordIndex
+
+
+def test_prefix_search_matches_words_and_their_tokens():
+    index = WordIndex()
+    index.add_category('animal', ['Snow Leopard', 'snail', 'cat'])
+    index.add_category('weather', ['snow'])
+    assert index.search('sn') == [('snail', 'animal'), ('Snow Leopard', 'animal'), ('snow', 'weather')]
+    assert index.search('leo') == [('Snow Leopard', 'animal')]
+    assert index.search('  ') == []
+
+
+def test_search_limit():
+    index = WordIndex()
+    index.add_category('number', [f'n{value}' for value in range(100)])
+    assert len(index.search('n', limit=10)) == 10
+
+
+def test_reindexing_a_category_replaces_its_words():
+    index = WordIndex()
+    index.add_category('animal', ['cat', 'cow'])
+    index.add_category('pet', ['cat'])
+    index.add_category('animal', ['cow', 12])
+    assert index.search('c') == [('cat', 'pet'), ('cow', 'animal')]
+    index.remove_category('pet')
+    assert index.search('cat') == []
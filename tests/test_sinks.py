@@ -0,0 +1,112 @@
+import csv
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from pb_core import (
+    CompiledTemplate, PromptSink, SamplingConstraints, create_sink, export_prompts, reproduce_prompt, template_id
+)
+
+
+class ListSink(PromptSink):
+    """Keep the written rows in memory."""
+
+    def __init__(self, batch_size=7):
+        super().__init__(batch_size)
+        self.written = []
+
+    def write_rows(self, rows):
+        self.written.extend(rows)
+
+
+@pytest.fixture
+def compiled(make_vocabulary):
+    vocabulary = make_vocabulary({}, {'animal': [f'animal{index}' for index in range(20)], 'color': ['red', 'blue']})
+    return CompiledTemplate('A [color] [animal] and a [animal]', vocabulary)
+
+
+def test_rows_are_written_in_batches(compiled):
+    sink = ListSink(batch_size=7)
+    sink.write('one')
+    assert sink.written == []
+    progress = {}
+    export_prompts(compiled, 20, sink, seed=1, progress=progress)
+    assert len(sink.written) == 21
+    assert progress["done"] == 20
+
+
+def test_prompt_sink_is_abstract():
+    with pytest.raises(TypeError):
+        PromptSink()
+
+
+@pytest.mark.parametrize('balanced', [False, True])
+def test_rows_record_batch_seed_and_index(compiled, balanced):
+    sink = ListSink()
+    export_prompts(compiled, 50, sink, seed=2, balanced=balanced)
+    seeds = {seed for _, _, seed, _, _ in sink.written}
+    assert len(seeds) == 1
+    assert [index for _, _, _, index, _ in sink.written] == list(range(50))
+    # Any row can be reproduced from its batch seed and index
+    prompt, identifier, seed, index, slots = sink.written[37]
+    assert identifier == template_id(compiled.template)
+    assert reproduce_prompt(compiled, seed, index, balanced=balanced) == (prompt, slots)
+
+
+def test_export_is_reproducible_from_the_seed(compiled):
+    first, second = ListSink(), ListSink()
+    export_prompts(compiled, 30, first, seed=3)
+    export_prompts(compiled, 30, second, seed=3)
+    assert first.written == second.written
+
+
+def test_jsonl_sink(tmp_path, compiled):
+    path = str(tmp_path / 'out.jsonl.gz')
+    with create_sink(path, batch_size=4) as sink:
+        export_prompts(compiled, 10, sink, seed=4)
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        rows = [json.loads(line) for line in file]
+    assert len(rows) == 10
+    assert rows[3]["index"] == 3
+    assert [slot["placeholder"] for slot in rows[0]["slots"]] == ['color', 'animal', 'animal']
+    assert rows[0]["prompt"] == 'A {} {} and a {}'.format(*(slot["word"] for slot in rows[0]["slots"]))
+
+
+def test_csv_and_lines_sinks(tmp_path, compiled):
+    csv_path, lines_path = str(tmp_path / 'out.csv'), str(tmp_path / 'out.txt')
+    for path in (csv_path, lines_path):
+        with create_sink(path) as sink:
+            export_prompts(compiled, 5, sink, seed=5)
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ['prompt', 'template_id', 'seed', 'index', 'slots']
+    with open(lines_path, encoding='utf-8') as file:
+        assert file.read().splitlines() == [row[0] for row in rows[1:]]
+
+
+def test_sqlite_sink(tmp_path, compiled):
+    path = str(tmp_path / 'out.db')
+    with create_sink(path, batch_size=3) as sink:
+        export_prompts(compiled, 10, sink, seed=6)
+    connection = sqlite3.connect(path)
+    assert connection.execute('SELECT COUNT(*), MAX("index") FROM prompts').fetchone() == (10, 9)
+    connection.close()
+
+
+def test_create_sink_rejects_unknown_formats(tmp_path):
+    with pytest.raises(ValueError):
+        create_sink(str(tmp_path / 'out.xml'))
+    with pytest.raises(ValueError):
+        create_sink(str(tmp_path / 'out.db.gz'))
+
+
+def test_lines_sink_keeps_one_prompt_per_line(tmp_path, make_vocabulary):
+    vocabulary = make_vocabulary({}, {'word': ['two\nlines']})
+    compiled = CompiledTemplate('[word]', vocabulary, SamplingConstraints())
+    path = str(tmp_path / 'out.txt')
+    with create_sink(path) as sink:
+        export_prompts(compiled, 2, sink)
+    with open(path, encoding='utf-8') as file:
+        assert file.read() == 'two lines\ntwo lines\n'
@@ -0,0 +1,15 @@
+import os
+import shutil
+
+import pytest
+
+import check_startup
+
+
+@pytest.mark.skipif(
+    not os.environ.get("DISPLAY") and shutil.which("xvfb-run") is None,
+    reason="the startup check needs a display or xvfb-run"
+)
+def test_startup_is_within_budget():
+    # Starts PB.py with its real imports and fails if startup exceeds STARTUP_TIME_BUDGET
+    assert check_startup.main() == 0
@@ -0,0 +1,81 @@
+from pb_core import resolve_vocabulary
+
+BASE_TYPES = {'creature': ['animal', 'bird'], 'place': ['city']}
+BASE_WORDS = {'animal': ['cat', 'dog'], 'bird': ['owl'], 'city': ['Paris']}
+
+
+def test_words_are_loaded_once_as_tuples(make_vocabulary):
+    vocabulary = make_vocabulary(BASE_TYPES, BASE_WORDS)
+    assert vocabulary.category_types['creature'] == ('animal', 'bird')
+    assert vocabulary.words('animal') == ('cat', 'dog')
+    assert vocabulary.words('animal') is vocabulary.words('animal')
+
+
+def test_missing_word_lists_are_empty(make_vocabulary, capsys):
+    vocabulary = make_vocabulary(BASE_TYPES, {})
+    assert vocabulary.words('animal') == ()
+    assert 'not found' in capsys.readouterr().out
+
+
+def test_overlay_edits_words(make_vocabulary):
+    vocabulary = make_vocabulary(BASE_TYPES, BASE_WORDS, overlays=[{
+        'animal.json': {'remove': ['dog'], 'add': ['cow', 'cat']},
+        'bird.json': ['crow'],
+        'city.json': {'replace': ['Rome'], 'add': ['Oslo']},
+        'fish.json': {'add': ['cod']},
+    }])
+    assert vocabulary.words('animal') == ('cat', 'cow')
+    assert vocabulary.words('bird') == ('crow',)
+    assert vocabulary.words('city') == ('Rome', 'Oslo')
+    assert vocabulary.words('fish') == ('cod',)
+    assert vocabulary.has_category('fish')
+
+
+def test_overlay_edits_category_types(make_vocabulary):
+    vocabulary = make_vocabulary(BASE_TYPES, BASE_WORDS, overlays=[{
+        'category_types.json': {'creature': {'add': ['fish']}, 'place': None, 'food': ['bread']},
+    }])
+    assert dict(vocabulary.category_types) == {'creature': ('animal', 'bird', 'fish'), 'food': ('bread',)}
+
+
+def test_overlays_share_unchanged_categories(write_vocabulary):
+    base_dir, overlay_dirs = write_vocabulary(BASE_TYPES, BASE_WORDS, overlays=[{'bird.json': ['crow']}, {'city.json': ['Rome']}])
+    vocabulary = resolve_vocabulary(base_dir, overlay_dirs)
+    base = resolve_vocabulary(base_dir)
+    # Snapshots are cached per layer and the categories an overlay does not edit are the same tuples
+    assert resolve_vocabulary(base_dir, overlay_dirs[:1]) is resolve_vocabulary(base_dir, overlay_dirs[:1])
+    assert vocabulary.words('animal') is base.words('animal')
+    assert vocabulary.category_types['creature'] is base.category_types['creature']
+    assert (vocabulary.words('bird'), vocabulary.words('city')) == (('crow',), ('Rome',))
+
+
+def test_reload_drops_cached_snapshots(write_vocabulary):
+    base_dir, _ = write_vocabulary(BASE_TYPES, BASE_WORDS)
+    vocabulary = resolve_vocabulary(base_dir)
+    reloaded = resolve_vocabulary(base_dir, reload=True)
+    assert reloaded is not vocabulary
+    assert reloaded.version > vocabulary.version
+
+
+def test_invalid_overlay_entries_are_ignored(make_vocabulary, capsys):
+    vocabulary = make_vocabulary(BASE_TYPES, BASE_WORDS, overlays=[{
+        'animal.json': {'add': 'tiger'},
+        'bird.json': {'subject': ['oops']},
+        'category_types.json': {'creature': 'oops', 'place': {'add': ['town']}},
+    }])
+    assert 'Error' in capsys.readouterr().out
+    assert vocabulary.words('animal') == ('cat', 'dog')
+    assert vocabulary.words('bird') == ('owl',)
+    assert dict(vocabulary.category_types) == {'creature': ('animal', 'bird'), 'place': ('city', 'town')}
+
+
+def test_rejected_overlay_file_is_not_reported_as_missing(make_vocabulary, capsys):
+    vocabulary = make_vocabulary(BASE_TYPES, BASE_WORDS, overlays=[{'bad.json': 'oops', 'animal.json': 7}])
+    capsys.readouterr()
+    # A category only the overlay has gets no words, without a second "not found" error
+    assert vocabulary.words('bad') == ()
+    assert vocabulary.has_category('bad')
+    assert capsys.readouterr().out == ''
+    # A category below the overlay keeps its words, and the fallback is reported
+    assert vocabulary.words('animal') == ('cat', 'dog')
+    assert 'ignored' in capsys.readouterr().out